@@ -1,7 +1,8 @@
 import os
+import threading
+from collections import OrderedDict
 from pathlib import Path
-from typing import Any, List, Optional, Dict
-from dotenv import load_dotenv
+from typing import Any, List, Optional, Dict, Tuple
 from langchain_nomic.embeddings import NomicEmbeddings
 from langchain_groq import ChatGroq
 from langchain_pinecone import PineconeVectorStore
@@ -10,8 +11,8 @@ from langchain_community.document_loaders import PyPDFLoader
 from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter, MarkdownHeaderTextSplitter
 import traceback
+from semantic_cache import SemanticCache
 
-load_dotenv()
 class CompleteRagService:
     """End-to-end RAG service with ingestion and retrieval pipelines."""
 
@@ -19,6 +20,11 @@ class CompleteRagService:
         self.llm = llm
         self.vectorstore = vectorstore
         self.embedding_model = embedding_model
+        # Per-session retrieval results reused for near-duplicate queries (namespace = session_id)
+        self.query_cache = SemanticCache(embedding_model, threshold=0.95, max_entries=2000, ttl_seconds=300)
+        # Recent query text -> embedding, so retries and repeated questions skip the embed call
+        self._query_vectors: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._query_vectors_lock = threading.Lock()
 
     # -----------------------
     # Ingestion pipeline
@@ -152,7 +158,11 @@ class CompleteRagService:
         chunks = splitter.split_documents(docs)
         return chunks
 
-    def embed_docs(self, docs: List[Document], extra_metadata: Optional[Dict[str, Any]] = None) -> int:
+    def embed_docs(self, docs: List[Document], extra_metadata: Optional[Dict[str, Any]] = None, embedding_batch_size: int = 128, upsert_batch_size: int = 100, namespace: Optional[str] = None) -> int:
+        """Embed and upsert docs; texts go to embed_documents in embedding_batch_size groups.
+
+        A namespace partitions the index so searches in it never scan other tenants' vectors.
+        """
         if not docs:
             return 0
         if extra_metadata:
@@ -161,10 +171,11 @@ class CompleteRagService:
                     d.metadata.update(extra_metadata)
                 except Exception:
                     d.metadata = {**getattr(d, "metadata", {}), **extra_metadata}
-        self.vectorstore.add_documents(docs)
+        self.vectorstore.add_documents(docs, embedding_chunk_size=embedding_batch_size, batch_size=upsert_batch_size, namespace=namespace)
         return len(docs)
 
-    def ingest_pdf(self, pdf_path: str, markdown_dir: str = "ingested", chunk_size: int = 1000, chunk_overlap: int = 200, extra_metadata: Optional[Dict[str, Any]] = None) -> Dict[str, str | int]:
+    def parse_and_chunk_pdf(self, pdf_path: str, markdown_dir: str = "ingested", chunk_size: int = 1000, chunk_overlap: int = 200) -> Tuple[str, List[Document]]:
+        """Convert a PDF to Markdown and chunk it without embedding; returns (markdown_path, chunks)"""
         engine = os.getenv("PDF_TO_MD_ENGINE", "pymupdf4llm").lower()
         if engine == "pymupdf4llm":
             md_path = self.pdf_to_markdown_pymupdf4llm(pdf_path, output_dir=markdown_dir, base_name=Path(pdf_path).stem)
@@ -175,7 +186,24 @@ class CompleteRagService:
             md_path = self.save_as_markdown(docs, output_dir=markdown_dir, base_name=Path(pdf_path).stem)
 
         chunks = self.markdown_to_chunks(md_path, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-        num_chunks = self.embed_docs(chunks, extra_metadata=extra_metadata)
+        return md_path, chunks
+
+    def parse_and_chunk_text(self, text_path: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> List[Document]:
+        """Chunk a plain-text or Markdown file without embedding"""
+        if text_path.lower().endswith(".md"):
+            return self.markdown_to_chunks(text_path, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        with open(text_path, "r", encoding="utf-8") as f:
+            docs = [Document(page_content=f.read(), metadata={"source": text_path})]
+        return self.split_docs(docs, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+    def ingest_text(self, text_path: str, chunk_size: int = 1000, chunk_overlap: int = 200, extra_metadata: Optional[Dict[str, Any]] = None, embedding_batch_size: int = 128) -> Dict[str, str | int]:
+        chunks = self.parse_and_chunk_text(text_path, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        num_chunks = self.embed_docs(chunks, extra_metadata=extra_metadata, embedding_batch_size=embedding_batch_size)
+        return {"text_path": text_path, "num_chunks": num_chunks}
+
+    def ingest_pdf(self, pdf_path: str, markdown_dir: str = "ingested", chunk_size: int = 1000, chunk_overlap: int = 200, extra_metadata: Optional[Dict[str, Any]] = None, embedding_batch_size: int = 128) -> Dict[str, str | int]:
+        md_path, chunks = self.parse_and_chunk_pdf(pdf_path, markdown_dir=markdown_dir, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        num_chunks = self.embed_docs(chunks, extra_metadata=extra_metadata, embedding_batch_size=embedding_batch_size)
         return {"pdf_path": pdf_path, "markdown_path": md_path, "num_chunks": num_chunks}
 
     # -----------------------
@@ -189,6 +217,53 @@ class CompleteRagService:
         retrieved_docs = retriever.invoke(query)
         return retrieved_docs
 
+    def embed_query_cached(self, query: str) -> List[float]:
+        """Embed a query, reusing the vector for text embedded recently"""
+        with self._query_vectors_lock:
+            if query in self._query_vectors:
+                self._query_vectors.move_to_end(query)
+                return self._query_vectors[query]
+        vector = self.embedding_model.embed_query(query)
+        with self._query_vectors_lock:
+            self._query_vectors[query] = vector
+            while len(self._query_vectors) > 256:
+                self._query_vectors.popitem(last=False)
+        return vector
+
+    def similarity_search_filtered(self, query: str, k: int = 5, filter: Optional[Dict[str, Any]] = None, query_embedding: Optional[List[float]] = None, namespace: Optional[str] = None) -> List[Document]:
+        """Plain top-k search with the metadata filter applied inside the Pinecone query.
+
+        Unlike semantic_search this skips MMR, so only k vectors come back instead of fetch_k.
+        Pass query_embedding to skip embedding the query again.
+        """
+        return [doc for doc, _ in self.similarity_search_filtered_with_score(query, k=k, filter=filter, query_embedding=query_embedding, namespace=namespace)]
+
+    def similarity_search_filtered_with_score(self, query: str, k: int = 5, filter: Optional[Dict[str, Any]] = None, query_embedding: Optional[List[float]] = None, namespace: Optional[str] = None) -> List[Tuple[Document, float]]:
+        if query_embedding is None:
+            query_embedding = self.embed_query_cached(query)
+        return self.vectorstore.similarity_search_by_vector_with_score(query_embedding, k=k, filter=filter, namespace=namespace)
+
+    def session_search_with_score(self, query: str, session_id: str, k: int = 5, query_embedding: Optional[List[float]] = None) -> List[Tuple[Document, float]]:
+        """Top-k search over one session's attachments.
+
+        Sessions ingested before per-session namespaces keep their vectors in the default
+        namespace tagged with session_id metadata, so an empty namespace falls back to that.
+        """
+        if query_embedding is None:
+            query_embedding = self.embed_query_cached(query)
+        scored = self.similarity_search_filtered_with_score(query, k=k, query_embedding=query_embedding, namespace=session_id)
+        if scored:
+            return scored
+        return self.similarity_search_filtered_with_score(query, k=k, filter={"session_id": session_id}, query_embedding=query_embedding)
+
+    def session_search(self, query: str, session_id: str, k: int = 5, query_embedding: Optional[List[float]] = None) -> List[Document]:
+        return [doc for doc, _ in self.session_search_with_score(query, session_id, k=k, query_embedding=query_embedding)]
+
+    def rerank(self, scored_docs: List[Tuple[Document, float]], top_n: int = 3, min_score: float = 0.3) -> List[Document]:
+        """Keep the best top_n documents scoring at least min_score (cosine similarity)"""
+        ranked = sorted(scored_docs, key=lambda pair: pair[1], reverse=True)
+        return [doc for doc, score in ranked[:top_n] if score >= min_score]
+
     # -----------------------
     # Optional generation
     # -----------------------
@@ -211,6 +286,9 @@ class CompleteRagService:
 
 
 if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+
     # Environment configuration
     GROQ_API_KEY = os.getenv("GROQ_KEY")
     NOMIC_API_KEY = os.getenv("NOMIC_KEY")
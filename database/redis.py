@@ -45,4 +45,33 @@ class RedisService:
     def get_cached_diagram(self, session_id: str, diagram_type: str) -> Optional[str]:
         """Get cached diagram"""
         key = f"diagram:{session_id}:{diagram_type}"
-        return self.redis_client.get(key)
\ No newline at end of file
+        return self.redis_client.get(key)
+
+    def set_task(self, task_id: str, task: Dict[str, Any], ttl: int = 3600) -> None:
+        """Store background task status"""
+        key = f"task:{task_id}"
+        self.redis_client.setex(key, ttl, json.dumps(task, default=str))
+
+    def get_task(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Get background task status"""
+        key = f"task:{task_id}"
+        data = self.redis_client.get(key)
+        return json.loads(data) if data else None
+
+    def cache_title(self, idea_hash: str, title: str, ttl: int = 86400) -> None:
+        """Cache a generated professional title by normalized-idea hash"""
+        key = f"title:{idea_hash}"
+        self.redis_client.setex(key, ttl, title)
+
+    def get_cached_title(self, idea_hash: str) -> Optional[str]:
+        """Get cached professional title"""
+        key = f"title:{idea_hash}"
+        return self.redis_client.get(key)
+
+    def cache_value(self, key: str, value: str, ttl: int = 3600) -> None:
+        """Cache a string under a caller-built key"""
+        self.redis_client.setex(key, ttl, value)
+
+    def get_value(self, key: str) -> Optional[str]:
+        """Get a string cached with cache_value"""
+        return self.redis_client.get(key)
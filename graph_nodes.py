@@ -1,15 +1,62 @@
 from datetime import datetime
 import uuid
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Dict, Optional
 from langgraph.types import interrupt
 from state import PRDBuilderState
-from llm import LLMInterface
+from llm import SUMMARY_WINDOW, get_llm
 from langchain.schema import AIMessage
-from prompts import PRD_TEMPLATE_SECTIONS
+from langchain_core.messages import RemoveMessage
+from prompts import MANDATORY_KEYS, PRD_TEMPLATE_SECTIONS, SECTION_DEPENDENTS
 from state import PRDSection, SectionStatus, IntentType
+from version_store import append_version
 from langchain_core.prompts import ChatPromptTemplate
 
+log = logging.getLogger("graph_nodes")
+
+# Message history bounds, see _trim_messages
+_MESSAGE_TRIM_AT = 30
+_MESSAGE_KEEP = 10
+
+# Retrieval started by ThinkingLensPRDBuilder.send_message, keyed by session_id.
+# Nodes that read rag_context wait on it only when they actually need it.
+PENDING_RAG: Dict[str, Future] = {}
+
+# Guards the check-then-remove in discard_pending_rag against a concurrent turn's store
+_PENDING_RAG_LOCK = threading.Lock()
+
+def set_pending_rag(session_id: str, future: Future) -> Future:
+    with _PENDING_RAG_LOCK:
+        PENDING_RAG[session_id] = future
+    return future
+
+def discard_pending_rag(session_id: str, future: Optional[Future]) -> None:
+    """Drop a turn's unconsumed retrieval, unless a concurrent turn has replaced it"""
+    if future is None:
+        return
+    with _PENDING_RAG_LOCK:
+        if PENDING_RAG.get(session_id) is future:
+            del PENDING_RAG[session_id]
+
+def resolve_rag_context(state: PRDBuilderState) -> str:
+    """Fold in-flight retrieval for this session into state and return rag_context"""
+    with _PENDING_RAG_LOCK:
+        future = PENDING_RAG.pop(state["config"].session_id, None)
+    if future is not None:
+        try:
+            rag_context = future.result()
+        except Exception as e:
+            log.warning("[RAG] Retrieval failed: %s", e)
+            rag_context = ""
+        if rag_context:
+            state["rag_context"] = rag_context
+            state["rag_enabled"] = True
+    return state.get("rag_context", "")
+
 def idea_normalizer_node(state: PRDBuilderState) -> PRDBuilderState:
-	llm = LLMInterface()
+	llm = get_llm()
 
 	# Add agent introduction if this is the first message
 	if not state.get("messages") or len(state["messages"]) == 0:
@@ -57,7 +104,7 @@ I'm here to help you build a comprehensive Product Requirements Document (PRD) s
 		
 		if new_questions:
 			# Ask only new questions
-			qs = "\n".join(f"- {q}" for q in new_questions)
+			qs = "\n".join([f"- {q}" for q in new_questions])
 			state["asked_clarifying_questions"] = asked_questions + new_questions
 			state["needs_human_input"] = True
 			state["checkpoint_reason"] = "Need clarification for product idea"
@@ -92,7 +139,7 @@ I'm here to help you build a comprehensive Product Requirements Document (PRD) s
 				checklist_items=template["checklist"],
 				dependencies=template["dependencies"]
 			)
-			if template["mandatory"]:
+			if key in MANDATORY_KEYS:
 				section_order.append(key)
 		state["prd_sections"] = sections
 		state["section_order"] = section_order
@@ -144,7 +191,7 @@ def section_planner_node(state: PRDBuilderState) -> PRDBuilderState:
 
 def section_questioner_node(state: PRDBuilderState) -> PRDBuilderState:
     """Ask targeted questions for the current section"""
-    llm = LLMInterface()
+    llm = get_llm()
     current_section = state["config"].current_section
     
     if not current_section:
@@ -168,10 +215,11 @@ def section_questioner_node(state: PRDBuilderState) -> PRDBuilderState:
                               if v.status == SectionStatus.COMPLETED],
         "conversation_summary": state.get("conversation_summary", ""),
         "prd_snapshot": state.get("prd_snapshot", "")[:2000],
-        "rag_context": state.get("rag_context", ""),
+        "rag_context": resolve_rag_context(state),
     }
     
-    # Generate questions
+    # Generated per turn from the current context (through the semantic cache), so answers
+    # given to earlier sections always reach the questions
     questions = llm.generate_section_questions(current_section, context)
     
     # Update section status
@@ -185,14 +233,18 @@ def section_questioner_node(state: PRDBuilderState) -> PRDBuilderState:
     
     return state
 
+def build_intent_context(state: PRDBuilderState) -> str:
+    """Context string passed to the intent classifier"""
+    return f"Normalized idea: {state['normalized_idea']}\nCurrent progress: {len([s for s in state['prd_sections'].values() if s.status == SectionStatus.COMPLETED])} sections done"
+
 def intent_classifier_node(state: PRDBuilderState) -> PRDBuilderState:
     """Classify user intent and determine routing"""
-    llm = LLMInterface()
+    llm = get_llm()
     user_message = state["latest_user_input"]
     current_section = state["config"].current_section or ""
     
     # Build context
-    context = f"Normalized idea: {state['normalized_idea']}\nCurrent progress: {len([s for s in state['prd_sections'].values() if s.status == SectionStatus.COMPLETED])} sections done"
+    context = build_intent_context(state)
     
     classification = llm.classify_intent(user_message, current_section, context)
     
@@ -203,7 +255,7 @@ def intent_classifier_node(state: PRDBuilderState) -> PRDBuilderState:
 
 def section_updater_node(state: PRDBuilderState) -> PRDBuilderState:
     """Update PRD sections based on classified intent"""
-    llm = LLMInterface()
+    llm = get_llm()
     
     intent = state["intent_classification"]
     target_section = state["target_section"] or state["config"].current_section
@@ -221,7 +273,7 @@ def section_updater_node(state: PRDBuilderState) -> PRDBuilderState:
         "prd_sections": {k: v.content for k, v in state["prd_sections"].items() if v.content},
         "conversation_summary": state.get("conversation_summary", ""),
         "prd_snapshot": state.get("prd_snapshot", "")[:2000],
-        "rag_context": state.get("rag_context", ""),
+        "rag_context": resolve_rag_context(state),
     }
     
     # Update section content
@@ -233,6 +285,7 @@ def section_updater_node(state: PRDBuilderState) -> PRDBuilderState:
     section.content = update_result["updated_content"]
     section.completion_score = update_result["completion_score"]
     section.last_updated = datetime.now()
+    section.last_updated_iso = section.last_updated.isoformat()
     
     state["run_assembler"] = True
 
@@ -242,10 +295,11 @@ def section_updater_node(state: PRDBuilderState) -> PRDBuilderState:
         section.status = SectionStatus.IN_PROGRESS  # Reset to in-progress
         
         # Mark dependencies stale on revision
-        for k, s in state["prd_sections"].items():
-            if target_section in s.dependencies and s.status == SectionStatus.COMPLETED:
+        prd_sections = state["prd_sections"]
+        for k in SECTION_DEPENDENTS.get(target_section, ()):
+            s = prd_sections.get(k)
+            if s is not None and s.status == SectionStatus.COMPLETED:
                 s.status = SectionStatus.STALE
-                state["prd_sections"][k] = s
         
         # Ask for confirmation of changes
         state["messages"].append(AIMessage(content=f"Updated {PRD_TEMPLATE_SECTIONS[target_section]['title']} section. Would you like to make more changes to this section or move on?"))
@@ -298,8 +352,41 @@ def section_updater_node(state: PRDBuilderState) -> PRDBuilderState:
             state["conversation_summary"] = recent_summary
         except Exception:
             pass
+    _trim_messages(state, llm)
     
     return state
+
+def _trim_messages(state: PRDBuilderState, llm) -> None:
+    """Fold the oldest messages into conversation_summary and drop them from state.
+
+    Every checkpoint write carries the full message list, while nodes only read the
+    latest few messages plus the summary, so the list is cut back to _MESSAGE_KEEP
+    once it grows past _MESSAGE_TRIM_AT.
+    """
+    messages = state["messages"]
+    if len(messages) <= _MESSAGE_TRIM_AT:
+        return
+    head, tail = messages[:-_MESSAGE_KEEP], messages[-_MESSAGE_KEEP:]
+    # The summarizer only reads SUMMARY_WINDOW messages per call, so fold the head in
+    # chunk by chunk; only messages that made it into the summary are removed
+    summary = state.get("conversation_summary", "")
+    summarized = 0
+    for start in range(0, len(head), SUMMARY_WINDOW):
+        chunk = head[start:start + SUMMARY_WINDOW]
+        try:
+            summary = llm.summarize_conversation(chunk, summary)
+        except Exception as e:
+            # Keep the rest of the history rather than lose it unsummarized; the next update retries
+            log.warning("[PRD] Summarizing before trimming messages failed: %s", e)
+            break
+        summarized = start + len(chunk)
+    if not summarized:
+        return
+    state["conversation_summary"] = summary
+    # add_messages applies the removals and keeps the rest (including anything appended this step)
+    state["messages"] = [RemoveMessage(id=m.id) for m in head[:summarized] if m.id] + list(head[summarized:]) + list(tail)
+
+
 def meta_responder_node(state: PRDBuilderState) -> PRDBuilderState:
     """Handle meta queries about progress and status"""
     completed = [k for k, v in state["prd_sections"].items() if v.status == SectionStatus.COMPLETED]
@@ -398,7 +485,7 @@ def assembler_node(state: PRDBuilderState) -> PRDBuilderState:
 	state["assembler_last_run"] = datetime.now().isoformat()
 	
 	if "professional_title" not in state or not state.get("professional_title"):
-		llm = LLMInterface()
+		llm = get_llm()
 		professional_title = llm.generate_professional_title(state.get("normalized_idea", ""))
 		state["professional_title"] = professional_title
 
@@ -438,7 +525,7 @@ def assembler_node(state: PRDBuilderState) -> PRDBuilderState:
 	for title in section_titles:
 		header_count = prd_content.count(f"## {title}")
 		if header_count > 1:
-			print(f"WARNING: Duplicate section header found for '{title}' - {header_count} occurrences")
+			log.warning("Duplicate section header found for '%s' - %s occurrences", title, header_count)
 			# Fix the duplicate by keeping only the first occurrence
 			parts = prd_content.split(f"## {title}")
 			if len(parts) > 1:
@@ -449,7 +536,7 @@ def assembler_node(state: PRDBuilderState) -> PRDBuilderState:
 					fixed_content += parts[i]
 				prd_content = fixed_content
 				state["prd_snapshot"] = prd_content
-				print(f"Fixed duplicate section '{title}'")
+				log.info("Fixed duplicate section '%s'", title)
 	
 	# Reset assembler flag to prevent multiple calls
 	state["run_assembler"] = False
@@ -492,8 +579,11 @@ def exporter_node(state: PRDBuilderState) -> PRDBuilderState:
         "content": export_content,
     }
     versions = state.get("versions", [])
-    versions.append(version)
+    append_version(versions, version)
     state["versions"] = versions
+    versions_by_id = state.get("versions_by_id")
+    if versions_by_id is not None:
+        versions_by_id[version["version_id"]] = len(versions) - 1
     
     message = f"""📄 **PRD Export Complete!**
     
@@ -510,7 +600,7 @@ def exporter_node(state: PRDBuilderState) -> PRDBuilderState:
     
 def refiner_node(state: PRDBuilderState) -> PRDBuilderState:
     """Refine the assembled PRD with an editorial pass and expand issues."""
-    llm = LLMInterface()
+    llm = get_llm()
     full_text = state.get("prd_snapshot", "")
     if not full_text:
         return state
@@ -1,6 +1,8 @@
-from llm import LLMInterface
+from llm import get_llm
+from graph_nodes import build_intent_context
 from state import PRDBuilderState, IntentType, SectionStatus
 from langgraph.graph import END
+
 def route_after_classification(state: PRDBuilderState) -> str:
     """Route based on intent classification"""
     intent = state["intent_classification"]
@@ -54,9 +56,9 @@ def route_after_human_input(state: PRDBuilderState) -> str:
                     return "intent_classifier"
                 # LLM detector (already in your file)
                 try:
-                    llm = LLMInterface()
-                    res = llm.is_substantive_section_answer(current, msg, section.checklist_items)
-                    if res.get("substantive") and float(res.get("confidence", 0)) >= 0.6:
+                    # One call answers both questions; the intent half is cached for intent_classifier_node
+                    res = get_llm().classify_and_score(msg, current, build_intent_context(state), section.checklist_items)
+                    if res.get("substantive") and float(res.get("sub_confidence", 0)) >= 0.6:
                         return "intent_classifier"
                 except Exception:
                     pass
@@ -1,18 +1,47 @@
 import os
-from typing import List
+import uuid
+import hashlib
+import asyncio
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+
+# Load .env once, before any module that reads configuration is imported
+load_dotenv()
+
+import atexit
+import logging
+import logging.handlers
+import queue
+import threading
+from collections import OrderedDict
+
+# Log records are queued on the calling thread and formatted/written by a
+# background listener, so request threads never block on log I/O
+_log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+_log_stream = logging.StreamHandler()
+_log_stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+_log_listener = logging.handlers.QueueListener(_log_queue, _log_stream)
+logging.getLogger().addHandler(logging.handlers.QueueHandler(_log_queue))
+logging.getLogger().setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+_log_listener.start()
+atexit.register(_log_listener.stop)
+log = logging.getLogger("main")
+
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import anyio
 import uvicorn
-from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
+from fastapi import FastAPI, File, Form, Header, HTTPException, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from time import perf_counter
 from database.database import MongoDBService
 from database.redis import RedisService
 from prd_builder import ThinkingLensPRDBuilder
-from fastapi.responses import StreamingResponse
-from langgraph.types import Command
-import json
+from prompts import MANDATORY_KEYS
+from fastapi.responses import JSONResponse, ORJSONResponse, Response, StreamingResponse
+import orjson
 
-app = FastAPI(title="ThinkingLens PRD Builder")
+app = FastAPI(title="ThinkingLens PRD Builder", default_response_class=ORJSONResponse)
 agent = ThinkingLensPRDBuilder()
 
 # CORS (adjust as needed)
@@ -32,94 +61,339 @@ async def add_process_time_header(request: Request, call_next):
     response.headers["X-Process-Time-ms"] = str(round((perf_counter() - start) * 1000, 1))
     return response
 
+UPLOAD_CHUNK_SIZE = 1 << 20
+TASK_POLL_INTERVAL = 0.5
+SSE_MAX_FRAMES_PER_FLUSH = 8
+LONG_POLL_MAX_SECONDS = 60.0
+IDEMPOTENCY_TTL_SECONDS = 600.0
+IDEMPOTENCY_MAX_ENTRIES = 4096
+
+# Idempotency-Key -> (stored_at, future of (status, headers, body)) for POSTs that carried one.
+# Entries are only ever appended, so the oldest is always at the front.
+_idempotent: "OrderedDict[str, Tuple[float, asyncio.Future]]" = OrderedDict()
+
+@app.middleware("http")
+async def replay_idempotent_posts(request: Request, call_next):
+    """Answer a retried POST with the first attempt's response instead of applying it twice"""
+    key = request.headers.get("Idempotency-Key")
+    if request.method != "POST" or not key:
+        return await call_next(request)
+    now = perf_counter()
+    while _idempotent and now - next(iter(_idempotent.values()))[0] > IDEMPOTENCY_TTL_SECONDS:
+        _idempotent.popitem(last=False)
+    if key in _idempotent:
+        # A retry of an attempt that may still be running waits for its result
+        status_code, headers, body = await _idempotent[key][1]
+        return Response(content=body, status_code=status_code, headers=headers)
+    result = asyncio.get_running_loop().create_future()
+    _idempotent[key] = (now, result)
+    while len(_idempotent) > IDEMPOTENCY_MAX_ENTRIES:
+        _idempotent.popitem(last=False)
+    try:
+        response = await call_next(request)
+        body = b"".join([chunk async for chunk in response.body_iterator])
+    except Exception as e:
+        _idempotent.pop(key, None)
+        result.set_exception(e)
+        # Mark retrieved so an unawaited failure does not log a warning
+        result.exception()
+        raise
+    if response.status_code >= 500:
+        # Server errors are worth a real retry, so only in-flight duplicates see this one
+        _idempotent.pop(key, None)
+    headers = dict(response.headers)
+    result.set_result((response.status_code, headers, body))
+    return Response(content=body, status_code=response.status_code, headers=headers)
+
+# Background tasks: status lives in Redis under task:<id> when available, else in memory.
+# Both expire after TASK_TTL_SECONDS; the in-memory store is also capped at TASK_MAX_ENTRIES.
+TASK_TTL_SECONDS = 3600
+TASK_MAX_ENTRIES = 1024
+# task_id -> (stored_at, task), oldest write first; touched from worker threads via to_thread
+_tasks: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+_tasks_lock = threading.Lock()
+_running_tasks: set = set()
+
+def _expire_tasks(now: float) -> None:
+    # Caller holds _tasks_lock
+    while _tasks and now - next(iter(_tasks.values()))[0] > TASK_TTL_SECONDS:
+        _tasks.popitem(last=False)
+
+def _set_task(task_id: str, task: Dict[str, Any]) -> None:
+    redis_service = agent.redis_service
+    if redis_service and redis_service.redis_client:
+        try:
+            redis_service.set_task(task_id, task, ttl=TASK_TTL_SECONDS)
+            return
+        except Exception as e:
+            log.warning("[TASK] Redis task store failed, keeping in memory: %s", e)
+    now = perf_counter()
+    with _tasks_lock:
+        _expire_tasks(now)
+        _tasks[task_id] = (now, task)
+        _tasks.move_to_end(task_id)
+        while len(_tasks) > TASK_MAX_ENTRIES:
+            _tasks.popitem(last=False)
+
+def _get_task(task_id: str) -> Optional[Dict[str, Any]]:
+    with _tasks_lock:
+        _expire_tasks(perf_counter())
+        entry = _tasks.get(task_id)
+    if entry is not None:
+        return entry[1]
+    redis_service = agent.redis_service
+    if redis_service and redis_service.redis_client:
+        try:
+            return redis_service.get_task(task_id)
+        except Exception as e:
+            log.warning("[TASK] Redis task lookup failed: %s", e)
+    return None
+
+# The task store makes blocking Redis round trips, so handlers go through these
+async def _aset_task(task_id: str, task: Dict[str, Any]) -> None:
+    await asyncio.to_thread(_set_task, task_id, task)
+
+async def _aget_task(task_id: str) -> Optional[Dict[str, Any]]:
+    return await asyncio.to_thread(_get_task, task_id)
+
+async def _enqueue(session_id: str, kind: str, job: Callable[[], Awaitable[Dict]]) -> JSONResponse:
+    """Run job in the background and return 202 with a task id to poll"""
+    task_id = str(uuid.uuid4())
+    await _aset_task(task_id, {"task_id": task_id, "session_id": session_id, "kind": kind, "status": "pending"})
+
+    async def run() -> None:
+        try:
+            result = await job()
+            await _aset_task(task_id, {"task_id": task_id, "session_id": session_id, "kind": kind, "status": "done", "result": result})
+        except Exception as e:
+            await _aset_task(task_id, {"task_id": task_id, "session_id": session_id, "kind": kind, "status": "error", "message": str(e)})
+
+    task = asyncio.create_task(run())
+    _running_tasks.add(task)
+    task.add_done_callback(_running_tasks.discard)
+    return JSONResponse(status_code=202, content={"task_id": task_id, "status": "pending"})
+
 class StartSessionRequest(BaseModel):
     user_id: str
     idea: str
+    # Sent as the first message right after the session starts, saving the client a round trip
+    initial_message: Optional[str] = None
 
 class MessageRequest(BaseModel):
     message: str
 
 @app.post("/sessions")
-def start_session(body: StartSessionRequest):
-    return agent.start_session(user_id=body.user_id, initial_idea=body.idea)
+async def start_session(body: StartSessionRequest):
+    res = await agent.astart_session(user_id=body.user_id, initial_idea=body.idea)
+    if body.initial_message is None or res.get("status") != "success":
+        return res
+    # The reply to the initial message carries the session_id, so it stands in for the start response
+    follow_up = await agent.asend_message(session_id=res["session_id"], message=body.initial_message)
+    if follow_up.get("status") != "success":
+        raise HTTPException(status_code=400, detail=follow_up.get("message", "error"))
+    return follow_up
 
 @app.post("/sessions/{session_id}/message")
-def send_message(session_id: str, body: MessageRequest):
-    res = agent.send_message(session_id=session_id, message=body.message)
+async def send_message(session_id: str, body: MessageRequest):
+    res = await agent.asend_message(session_id=session_id, message=body.message)
     if res.get("status") != "success":
         raise HTTPException(status_code=400, detail=res.get("message", "error"))
     return res
 
-@app.get("/sessions/{session_id}/prd")
-def get_prd(session_id: str):
-    res = agent.get_prd_draft(session_id)
+# session_id -> (loop, queue) per open watcher; woken whenever the session's state is written
+_session_watchers: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+
+def _on_state_written(session_id: str) -> None:
+    # Runs on whichever thread wrote the state
+    for loop, q in list(_session_watchers.get(session_id, ())):
+        loop.call_soon_threadsafe(q.put_nowait, None)
+
+agent.add_state_listener(_on_state_written)
+
+@asynccontextmanager
+async def _watch_session(session_id: str):
+    """Yield a queue that receives None after every write to the session's state"""
+    watcher = (asyncio.get_running_loop(), asyncio.Queue())
+    _session_watchers.setdefault(session_id, []).append(watcher)
+    try:
+        yield watcher[1]
+    finally:
+        watchers = _session_watchers.get(session_id, [])
+        if watcher in watchers:
+            watchers.remove(watcher)
+        if not watchers:
+            _session_watchers.pop(session_id, None)
+
+@app.post("/sessions/{session_id}/turn")
+async def take_turn(session_id: str, body: MessageRequest):
+    """Send a message and return its reply merged with the post-turn PRD state in one round trip"""
+    res = await agent.asend_message(session_id=session_id, message=body.message)
+    if res.get("status") != "success":
+        raise HTTPException(status_code=400, detail=res.get("message", "error"))
+    draft = await agent.aget_prd_draft(session_id)
+    if draft.get("status") != "success":
+        raise HTTPException(status_code=404, detail=draft.get("message", "not found"))
+    res["current_stage"] = draft["current_stage"]
+    res["current_section"] = draft["current_section"]
+    res["sections_completed"] = draft["sections_completed"]
+    return res
+
+async def _wait_for_section(session_id: str, section: str, timeout: float, read: Callable[[str], Awaitable[Dict]]) -> Dict:
+    """Long-poll: re-read on each state write until section completes or the timeout passes"""
+    deadline = perf_counter() + min(timeout, LONG_POLL_MAX_SECONDS)
+    async with _watch_session(session_id) as changes:
+        # Read once registered so a write in between is not missed
+        res = await read(session_id)
+        while section not in res["sections_completed"]:
+            try:
+                await asyncio.wait_for(changes.get(), deadline - perf_counter())
+            except asyncio.TimeoutError:
+                break
+            res = await read(session_id)
+    return res
+
+@app.get("/sessions/{session_id}/prd/status")
+async def get_prd_status(session_id: str, wait_for: Optional[str] = None, timeout: float = 30.0):
+    """Completion metadata only; accepts the same wait_for long-poll as /prd"""
+    res = await agent.aget_prd_status(session_id)
     if res.get("status") != "success":
         raise HTTPException(status_code=404, detail=res.get("message", "not found"))
+    if wait_for and wait_for not in res["sections_completed"]:
+        res = await _wait_for_section(session_id, wait_for, timeout, agent.aget_prd_status)
     return res
 
+@app.get("/sessions/{session_id}/prd")
+async def get_prd(
+    session_id: str,
+    sections: bool = True,
+    wait_for: Optional[str] = None,
+    timeout: float = 30.0,
+    if_none_match: Optional[str] = Header(None),
+):
+    # ?sections=false returns just the assembled snapshot and stage
+    res = await agent.aget_prd_draft(session_id, include_sections=sections)
+    if res.get("status") != "success":
+        raise HTTPException(status_code=404, detail=res.get("message", "not found"))
+    if wait_for and sections and wait_for not in res["sections_completed"]:
+        res = await _wait_for_section(session_id, wait_for, timeout, agent.aget_prd_draft)
+    # The draft carries the full snapshot and every section; serialize once with orjson
+    # and tag the bytes so an unchanged draft costs the client a 304 instead of the body
+    body = orjson.dumps(res)
+    etag = 'W/"%s"' % hashlib.blake2b(body, digest_size=8).hexdigest()
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
 @app.post("/sessions/{session_id}/refine")
-def refine(session_id: str):
-    res = agent.send_message(session_id=session_id, message="refine")
+async def refine(session_id: str):
+    res = await agent.asend_message(session_id=session_id, message="refine")
     if res.get("status") != "success":
         raise HTTPException(status_code=400, detail=res.get("message", "error"))
     return res
 
 @app.post("/sessions/{session_id}/export")
-def export(session_id: str):
-	res = agent.send_message(session_id=session_id, message="export")
+async def export(session_id: str, background: bool = False):
+	if background:
+		return await _enqueue(session_id, "export", lambda: agent.asend_message(session_id=session_id, message="export"))
+	res = await agent.asend_message(session_id=session_id, message="export")
 	if res.get("status") != "success":
 		raise HTTPException(status_code=400, detail=res.get("message", "error"))
 	return res
     
-@app.get("/sessions/{session_id}/stream")
-def stream_message(session_id: str, message: str):
-    def event_stream():
-        thread_config = {"configurable": {"thread_id": session_id}}
-        snapshot = agent.app.get_state(thread_config)
-        if not snapshot.values:
-            yield f"event: error\ndata: {json.dumps({'error': 'Session not found'})}\n\n"
-            return
+def _stream_frames(session_id: str, message: str):
+    """Run the graph for one message and yield SSE frames as bytes (blocking)"""
+    try:
+        for ev in agent.send_message_stream(session_id, message):
+            out = {
+                "stage": ev.get("current_stage"),
+                "current_section": (ev["config"].current_section if "config" in ev else None),
+                "needs_input": ev.get("needs_human_input", False),
+                "last_message": (ev["messages"][-1].content if ev.get("messages") else None),
+            }
+            yield b"data: " + orjson.dumps(out) + b"\n\n"
+    except Exception as e:
+        yield b"event: error\ndata: " + orjson.dumps({"error": str(e)}) + b"\n\n"
 
-        pending_next = getattr(snapshot, "next", None)
-        is_waiting_human = False
-        if isinstance(pending_next, (list, tuple)):
-            is_waiting_human = "human_input" in pending_next
-        elif isinstance(pending_next, str):
-            is_waiting_human = pending_next == "human_input"
-        else:
-            is_waiting_human = bool(snapshot.values.get("needs_human_input", False))
 
-        input_payload = Command(resume=message) if is_waiting_human else {
-            "latest_user_input": message,
-            "needs_human_input": False,
-        }
+@app.get("/sessions/{session_id}/stream")
+async def stream_message(session_id: str, message: str):
+    async def event_stream():
+        # The graph runs synchronously, so drive it on a worker thread and hand
+        # frames back to the event loop through a queue
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
 
-        try:
-            for ev in agent.app.stream(input_payload, config=thread_config, stream_mode="values"):
-                out = {
-                    "stage": ev.get("current_stage"),
-                    "current_section": (ev["config"].current_section if "config" in ev else None),
-                    "needs_input": ev.get("needs_human_input", False),
-                    "last_message": (ev["messages"][-1].content if ev.get("messages") else None),
-                }
-                yield f"data: {json.dumps(out)}\n\n"
-                if ev.get("needs_human_input"):
+        def produce() -> None:
+            try:
+                for frame in _stream_frames(session_id, message):
+                    loop.call_soon_threadsafe(queue.put_nowait, frame)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, None)
+
+        producer = loop.run_in_executor(None, produce)
+        done = False
+        while not done:
+            frame = await queue.get()
+            if frame is None:
+                break
+            # Frames that piled up while the client was being written to go out in one chunk
+            batch = [frame]
+            while len(batch) < SSE_MAX_FRAMES_PER_FLUSH and not queue.empty():
+                frame = queue.get_nowait()
+                if frame is None:
+                    done = True
                     break
-        except Exception as e:
-            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+                batch.append(frame)
+            yield b"".join(batch)
+        await producer
 
     return StreamingResponse(event_stream(), media_type="text/event-stream")
     
+# Once a session is here, /events has no further section completions to wait for
+_POST_BUILD_STAGES = frozenset({"assemble", "review", "export"})
+
+@app.get("/sessions/{session_id}/events")
+async def session_events(session_id: str):
+    """SSE stream of section_complete events; sections already completed are sent first.
+
+    Ends with a done event once every mandatory section is complete or the session has
+    moved past the build stage.
+    """
+    status = await agent.aget_prd_status(session_id)
+    if status.get("status") != "success":
+        raise HTTPException(status_code=404, detail=status.get("message", "not found"))
+
+    async def event_stream():
+        async with _watch_session(session_id) as changes:
+            # Read once registered so a write in between is not missed
+            status = await agent.aget_prd_status(session_id)
+            seen = set()
+            while True:
+                completed = status.get("sections_completed", [])
+                for key in completed:
+                    if key not in seen:
+                        seen.add(key)
+                        yield b"event: section_complete\ndata: " + orjson.dumps({"key": key}) + b"\n\n"
+                stage = status.get("current_stage")
+                if stage in _POST_BUILD_STAGES or MANDATORY_KEYS.issubset(completed):
+                    # Nothing more to report; close the stream and drop the watcher
+                    yield b"event: done\ndata: " + orjson.dumps({"stage": stage}) + b"\n\n"
+                    return
+                await changes.get()
+                status = await agent.aget_prd_status(session_id)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
 @app.get("/sessions/{session_id}/versions")
-def list_versions(session_id: str):
-    res = agent.list_versions(session_id)
+async def list_versions(session_id: str):
+    res = await agent.alist_versions(session_id)
     if res.get("status") != "success":
         raise HTTPException(status_code=404, detail=res.get("message", "not found"))
     return res
 
 @app.get("/sessions/{session_id}/versions/{version_id}")
-def get_version(session_id: str, version_id: str):
-    res = agent.get_version(session_id, version_id)
+async def get_version(session_id: str, version_id: str):
+    res = await agent.aget_version(session_id, version_id)
     if res.get("status") != "success":
         raise HTTPException(status_code=404, detail=res.get("message", "not found"))
     return res
@@ -130,38 +404,49 @@ async def send_message_with_files(session_id: str, files: List[UploadFile] = Fil
 	if files:
 		upload_dir = os.path.join("uploads", session_id)
 		os.makedirs(upload_dir, exist_ok=True)
-		for f in files:
+
+		async def save_one(f: UploadFile) -> str:
 			filename = f.filename or "upload"
 			dest = os.path.join(upload_dir, filename)
-			with open(dest, "wb") as out:
-				out.write(await f.read())
-			saved_paths.append(dest)
-	res = agent.send_message(session_id=session_id, message="", attachments=saved_paths if saved_paths else None)
+			# Copy in 1 MiB chunks so memory stays bounded regardless of file size
+			async with await anyio.open_file(dest, "wb") as out:
+				while chunk := await f.read(UPLOAD_CHUNK_SIZE):
+					await out.write(chunk)
+			return dest
+
+		saved_paths = list(await asyncio.gather(*(save_one(f) for f in files)))
+	res = await agent.asend_message(session_id=session_id, message="", attachments=saved_paths if saved_paths else None)
 	if res.get("status") != "success":
 		raise HTTPException(status_code=400, detail=res.get("message", "error"))
 	return res
 
 @app.post("/sessions/{session_id}/flowchart")
-def generate_flowchart(session_id: str, flowchart_type: str = "system_architecture"):
+async def generate_flowchart(session_id: str, flowchart_type: str = "system_architecture", background: bool = False):
     """Generate a technical flowchart based on the PRD"""
-    res = agent.generate_flowchart(session_id=session_id, flowchart_type=flowchart_type)
+    if background:
+        return await _enqueue(session_id, "flowchart", lambda: agent.agenerate_flowchart(session_id=session_id, flowchart_type=flowchart_type))
+    res = await agent.agenerate_flowchart(session_id=session_id, flowchart_type=flowchart_type)
     if res.get("status") != "success":
         raise HTTPException(status_code=400, detail=res.get("message", "error"))
     return res
 
 @app.post("/sessions/{session_id}/er-diagram")
-def generate_er_diagram(session_id: str, diagram_type: str = "database_schema"):
+async def generate_er_diagram(session_id: str, diagram_type: str = "database_schema", background: bool = False):
     """Generate an ER diagram based on the PRD"""
-    res = agent.generate_er_diagram(session_id=session_id, diagram_type=diagram_type)
+    if background:
+        return await _enqueue(session_id, "er_diagram", lambda: agent.agenerate_er_diagram(session_id=session_id, diagram_type=diagram_type))
+    res = await agent.agenerate_er_diagram(session_id=session_id, diagram_type=diagram_type)
     if res.get("status") != "success":
         raise HTTPException(status_code=400, detail=res.get("message", "error"))
     return res
 
 @app.post("/sessions/{session_id}/save")
-async def save_session(session_id: str):
+async def save_session(session_id: str, background: bool = False):
     """Save the current session to database permanently"""
+    if background:
+        return await _enqueue(session_id, "save", lambda: agent.asave_session_to_database(session_id))
     try:
-        result = agent.save_session_to_database(session_id)
+        result = await agent.asave_session_to_database(session_id)
         return result
     except Exception as e:
         return {"status": "error", "message": f"Failed to save session: {str(e)}"}
@@ -170,7 +455,7 @@ async def save_session(session_id: str):
 async def ask_prd_question(session_id: str, body: MessageRequest):
     """Ask questions about the completed PRD using RAG context"""
     try:
-        result = agent.ask_prd_question(session_id=session_id, question=body.message)
+        result = await agent.aask_prd_question(session_id=session_id, question=body.message)
         if result.get("status") != "success":
             raise HTTPException(status_code=400, detail=result.get("message", "error"))
         return result
@@ -178,5 +463,28 @@ async def ask_prd_question(session_id: str, body: MessageRequest):
         raise HTTPException(status_code=500, detail=f"Failed to process question: {str(e)}")
 
 
+@app.get("/tasks/{task_id}")
+async def get_task(task_id: str):
+    task = await _aget_task(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return task
+
+@app.get("/tasks/{task_id}/stream")
+async def stream_task(task_id: str):
+    async def event_stream():
+        while True:
+            task = await _aget_task(task_id)
+            if task is None:
+                yield b"event: error\ndata: " + orjson.dumps({"error": "Task not found"}) + b"\n\n"
+                return
+            yield b"data: " + orjson.dumps(task, default=str) + b"\n\n"
+            if task["status"] != "pending":
+                return
+            await asyncio.sleep(TASK_POLL_INTERVAL)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
@@ -1,58 +1,265 @@
 import os
-import uuid
+import sqlite3
+import logging
+import secrets
+import hashlib
 import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from datetime import datetime
-from langchain_nomic.embeddings import NomicEmbeddings
-from langchain_pinecone.vectorstores import PineconeVectorStore
-from pinecone import Pinecone, ServerlessSpec
+from functools import cached_property, lru_cache
+import httpx
+import openai
 from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
 from database.database import MongoDBService
 from database.redis import RedisService
 from graph import create_prd_builder_graph
-from typing import Dict, Any, List, Optional, cast
-from llm import LLMInterface
+from graph_nodes import discard_pending_rag, set_pending_rag
+from typing import TYPE_CHECKING, Callable, Dict, Any, Iterator, List, Optional, Tuple, cast
+from llm import get_llm, run_async
 from state import SessionConfig, PRDBuilderState, SectionStatus
+from version_store import materialize, materialize_all, version_content
 from langchain.schema import HumanMessage
-from prompts import PRD_TEMPLATE_SECTIONS 
+from prompts import SECTION_TITLES
 from langgraph.checkpoint.memory import InMemorySaver
 from langgraph.checkpoint.base import BaseCheckpointSaver
 from langchain_core.runnables import RunnableConfig
 from langgraph.types import Command
-from RAGService import CompleteRagService
 from langgraph.checkpoint.sqlite import SqliteSaver
 from langgraph.checkpoint.mongodb import MongoDBSaver
+from langgraph.checkpoint.mongodb.aio import AsyncMongoDBSaver
+
+if TYPE_CHECKING:
+    # RAG dependencies (Pinecone, Nomic, PDF parsing) load on first use in _build_rag
+    from RAGService import CompleteRagService
+
+log = logging.getLogger("prd_builder")
+
+# Scalar fields of a new session's state, shared by every start_session call
+_STATE_DEFAULTS = {
+    "normalized_idea": "",
+    "prd_snapshot": "",
+    "current_stage": "init",
+    "intent_classification": None,
+    "target_section": None,
+    "conversation_summary": "",
+    "needs_human_input": False,
+    "human_feedback": None,
+    "checkpoint_reason": "",
+    "run_assembler": False,
+    "rag_enabled": False,
+    "rag_context": "",
+    "professional_title": "",
+}
+
+# Attachment types routed to RAG ingestion, by lowercase suffix
+_PDF_SUFFIXES = frozenset({"pdf"})
+_TEXT_SUFFIXES = frozenset({"txt", "md", "text"})
+
+# Attachment ingestion (parse, chunk, embed, upsert) runs off the request path
+_INGEST_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="rag-ingest")
+
+# Per-message retrieval started before the graph run (see graph_nodes.resolve_rag_context)
+_RETRIEVAL_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="rag-retrieve")
+
+# Process-wide RAG service, created on first use
+_RAG_SINGLETON: Optional["CompleteRagService"] = None
+_RAG_LOCK = threading.Lock()
+
+_THREAD_CONFIG_CACHE_SIZE = 10_000
+
+# Checkpoint snapshots are reused for this long so polling endpoints skip the checkpointer
+_STATE_CACHE_TTL = 2.0
+_STATE_CACHE_SIZE = 1024
+
+@lru_cache(maxsize=4)
+def _shared_mongo_client(uri: Optional[str] = None) -> MongoClient:
+    """One pooled MongoClient per URI and process for the checkpointer; MongoClient is thread-safe"""
+    return MongoClient(uri or os.getenv("MONGODB_URI"), maxPoolSize=50)
+
+def _async_mongo_saver() -> AsyncMongoDBSaver:
+    """Motor-backed checkpointer living on the shared background loop.
+
+    The saver's sync methods hand each call to that loop, so graph runs on worker threads
+    wait on non-blocking Mongo I/O instead of each holding a pymongo socket. It reads and
+    writes the same collections as MongoDBSaver, so existing sessions carry over.
+    """
+    async def build() -> AsyncMongoDBSaver:
+        # Constructed inside the loop so the saver and Motor client both bind to it
+        client = AsyncIOMotorClient(os.getenv("MONGODB_URI"), maxPoolSize=50)
+        return AsyncMongoDBSaver(
+            client,
+            checkpoint_collection_name="checkpoints",
+            writes_collection_name="checkpoint_writes",
+        )
+    return run_async(build())
+
+@lru_cache(maxsize=4)
+def _shared_sqlite_conn(path: str = "prd_sessions.db") -> sqlite3.Connection:
+    """One WAL-mode connection per checkpoint database; SqliteSaver serializes access with its own lock"""
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-65536")
+    conn.execute("PRAGMA mmap_size=268435456")
+    return conn
+
+def _checkpointer_from_uri(uri: str) -> BaseCheckpointSaver:
+    """Checkpointer for a mongodb:// URI, a sqlite:/// URI, or a bare SQLite path such as ':memory:'"""
+    if uri.startswith(("mongodb://", "mongodb+srv://")):
+        return MongoDBSaver(_shared_mongo_client(uri))
+    if uri.startswith(("postgres://", "postgresql://")):
+        raise ValueError("Postgres checkpoints need langgraph-checkpoint-postgres, which is not a dependency of this project")
+    if uri.startswith("sqlite:///"):
+        uri = uri[len("sqlite:///"):]
+    return SqliteSaver(conn=_shared_sqlite_conn(uri))
+
+@lru_cache(maxsize=1)
+def _workflow() -> Any:
+    """The uncompiled PRD graph, wired once per process"""
+    return create_prd_builder_graph()
+
+@lru_cache(maxsize=4)
+def _compiled_app(checkpointer: BaseCheckpointSaver) -> Any:
+    """Compiled graph per checkpointer (keyed by identity), shared by builders that use the same one"""
+    return _workflow().compile(checkpointer=checkpointer)
+
+@lru_cache(maxsize=1)
+def _shared_db_services() -> Tuple[MongoDBService, RedisService]:
+    """PRD store and Redis cache clients, shared by every builder instance"""
+    return MongoDBService(), RedisService()
+
+# Resume attempts for network failures that are safe to retry (other errors surface at once)
+_RESUME_ATTEMPTS = 3
+_TRANSIENT_ERRORS = (httpx.TransportError, openai.APIConnectionError)
+
+# Messages made only of these words carry nothing worth retrieving for
+_STOPWORDS = frozenset({
+    "a", "an", "and", "the", "ok", "okay", "yes", "yeah", "yep", "no", "nope", "sure", "thanks",
+    "thank", "you", "please", "continue", "next", "go", "on", "done", "fine", "good", "great", "it", "that", "is",
+})
+
+def _retrieval_worthy(message: str) -> bool:
+    tokens = message.strip().split()
+    return len(tokens) >= 3 and not all(t.lower().strip(".,!?") in _STOPWORDS for t in tokens)
+
+def _cap_and_join(docs: List[Any], max_chars: int = 6000) -> str:
+    """Join retrieved chunks into rag_context, skipping repeated chunks and truncating at max_chars"""
+    out: List[str] = []
+    seen = set()
+    used = 0
+    for doc in docs:
+        content = doc.page_content
+        # Overlapping splits and re-uploaded files yield chunks that open with the same text
+        head = content[:256]
+        if head in seen:
+            continue
+        seen.add(head)
+        if used + len(content) > max_chars:
+            content = content[:max_chars - used]
+        out.append(content)
+        used += len(content) + 2
+        if used >= max_chars:
+            break
+    return "\n\n".join(out)
+
+def _is_waiting_human(snapshot: Any) -> bool:
+    """Whether the thread is paused at the human_input interrupt"""
+    pending_next = getattr(snapshot, "next", None) or ()
+    if isinstance(pending_next, str):
+        pending_next = (pending_next,)
+    if pending_next:
+        return "human_input" in pending_next
+    return bool(snapshot.values.get("needs_human_input", False))
+
+@lru_cache(maxsize=256)
+def _generated_title(normalized_idea: str) -> str:
+    # In-process memo so repeated draft reads without Redis do not regenerate the title
+    return get_llm().generate_professional_title(normalized_idea)
+
+def _snapshot_digest(prd_snapshot: str) -> str:
+    """Short digest of the assembled PRD so cached diagrams follow PRD edits"""
+    return hashlib.sha1(prd_snapshot.encode("utf-8")).hexdigest()[:12]
 
 class ThinkingLensPRDBuilder:
     """Main interface for the PRD Builder Agent"""
     
-    def __init__(self, checkpointer: BaseCheckpointSaver | None = None):
-        self.workflow = create_prd_builder_graph()
-        
-        if checkpointer is not None:
-            self.checkpointer = checkpointer
-        else:
-            if os.getenv("MONGODB_URI"):
+    def __init__(self, checkpointer: BaseCheckpointSaver | None = None, checkpointer_uri: Optional[str] = None):
+        self.workflow = _workflow()
+        # The checkpointer, compiled graph and database clients are built on first use,
+        # so operations that never touch them skip the connection setup
+        self._checkpointer_override = checkpointer
+        self._checkpointer_uri = checkpointer_uri
+        self._lazy_lock = threading.RLock()
+        self.rag: Optional["CompleteRagService"] = None
+        # (session_id, path) -> in-flight ingestion
+        self._ingest_futures: Dict[Tuple[str, str], Future] = {}
+        self._ingest_lock = threading.Lock()
+        # session_id -> RunnableConfig, reused across calls (LRU bounded)
+        self._thread_configs: "OrderedDict[str, RunnableConfig]" = OrderedDict()
+        self._thread_configs_lock = threading.Lock()
+        # session_id -> (monotonic time read, StateSnapshot); dropped whenever this class writes the thread
+        self._state_cache: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._state_cache_lock = threading.Lock()
+        self._state_listeners: List[Callable[[str], None]] = []
+        # session_id -> (len(versions) when built, {version_id: position in versions})
+        self._version_index: Dict[str, Tuple[int, Dict[str, int]]] = {}
+
+    @cached_property
+    def checkpointer(self) -> BaseCheckpointSaver:
+        with self._lazy_lock:
+            # Another thread may have finished building it while this one waited
+            if "checkpointer" in self.__dict__:
+                return self.__dict__["checkpointer"]
+            checkpointer = self._checkpointer_override
+            if checkpointer is None and self._checkpointer_uri:
+                checkpointer = _checkpointer_from_uri(self._checkpointer_uri)
+            if checkpointer is None and os.getenv("MONGODB_URI"):
                 try:
-                    client = MongoClient(os.getenv("MONGODB_URI"))
-                    self.checkpointer = MongoDBSaver(client)
-                    print(f"MongoDB checkpointer initialized successfully: {self.checkpointer}")
+                    # ASYNC_CHECKPOINTER=1 switches to the Motor saver; the sync saver stays the default for CLI use
+                    if os.getenv("ASYNC_CHECKPOINTER", "").lower() in ("1", "true", "yes"):
+                        checkpointer = _async_mongo_saver()
+                    else:
+                        checkpointer = MongoDBSaver(_shared_mongo_client())
+                    log.info("MongoDB checkpointer initialized successfully: %s", checkpointer)
                 except Exception as e:
-                    print(f"MongoDB checkpointer failed: {e}")
-                    self.checkpointer = SqliteSaver(conn="prd_sessions.db")
-            else:
-                self.checkpointer = SqliteSaver(conn="prd_sessions.db")
+                    log.warning("MongoDB checkpointer failed: %s", e)
+            if checkpointer is None:
+                checkpointer = SqliteSaver(conn=_shared_sqlite_conn())
+            self.__dict__["checkpointer"] = checkpointer
+            return checkpointer
 
-        self.app = self.workflow.compile(checkpointer=self.checkpointer)
-        self.rag: Optional[CompleteRagService] = None
+    @cached_property
+    def app(self) -> Any:
+        with self._lazy_lock:
+            if "app" not in self.__dict__:
+                self.__dict__["app"] = _compiled_app(self.checkpointer)
+            return self.__dict__["app"]
 
-        try:
-            self.mongodb_service = MongoDBService()
-            self.redis_service = RedisService()
-            print("Database services initialized successfully")
-        except Exception as e:
-            print(f"Database services initialization failed: {e}")
-            self.mongodb_service = None
-            self.redis_service = None
+    @cached_property
+    def _db_services(self) -> Tuple[Optional[MongoDBService], Optional[RedisService]]:
+        with self._lazy_lock:
+            if "_db_services" not in self.__dict__:
+                try:
+                    services = _shared_db_services()
+                    log.info("Database services initialized successfully")
+                except Exception as e:
+                    log.warning("Database services initialization failed: %s", e)
+                    services = (None, None)
+                self.__dict__["_db_services"] = services
+            return self.__dict__["_db_services"]
+
+    @property
+    def mongodb_service(self) -> Optional[MongoDBService]:
+        return self._db_services[0]
+
+    @property
+    def redis_service(self) -> Optional[RedisService]:
+        return self._db_services[1]
     
     def __del__(self):
         cm = getattr(self, "_checkpointer_cm", None)
@@ -62,40 +269,83 @@ class ThinkingLensPRDBuilder:
             except Exception:
                 pass
 
+    def _cfg(self, session_id: str) -> RunnableConfig:
+        """Thread config for a session, built once and reused"""
+        with self._thread_configs_lock:
+            cfg = self._thread_configs.get(session_id)
+            if cfg is None:
+                cfg = {"configurable": {"thread_id": session_id}}
+                self._thread_configs[session_id] = cfg
+                while len(self._thread_configs) > _THREAD_CONFIG_CACHE_SIZE:
+                    self._thread_configs.popitem(last=False)
+            else:
+                self._thread_configs.move_to_end(session_id)
+            return cfg
+
+    def _get_state(self, thread_config: RunnableConfig) -> Any:
+        """Checkpoint snapshot for a thread, served from a short-lived cache.
+
+        For read endpoints only: the cache is per process and may lag another worker's
+        writes, so paths that choose between resuming and starting a run read the
+        checkpointer directly.
+        """
+        thread_id = thread_config["configurable"]["thread_id"]
+        now = time.monotonic()
+        with self._state_cache_lock:
+            hit = self._state_cache.get(thread_id)
+            if hit is not None and now - hit[0] < _STATE_CACHE_TTL:
+                self._state_cache.move_to_end(thread_id)
+                return hit[1]
+        snapshot = self.app.get_state(thread_config)
+        with self._state_cache_lock:
+            self._state_cache[thread_id] = (now, snapshot)
+            while len(self._state_cache) > _STATE_CACHE_SIZE:
+                self._state_cache.popitem(last=False)
+        return snapshot
+
+    def invalidate_state(self, session_id: str) -> None:
+        """Forget the cached snapshot after the thread's state was written and notify listeners"""
+        with self._state_cache_lock:
+            self._state_cache.pop(session_id, None)
+        for listener in self._state_listeners:
+            try:
+                listener(session_id)
+            except Exception as e:
+                log.warning("[PRD] State listener failed for %s: %s", session_id, e)
+
+    def add_state_listener(self, listener: Callable[[str], None]) -> None:
+        """Call listener(session_id) after every write to a session's state, on the writing thread"""
+        self._state_listeners.append(listener)
+
     def start_session(self, user_id: str, initial_idea: str) -> Dict:
         """Start a new PRD building session"""
         
-        session_id = str(uuid.uuid4())
+        # The id is the only credential for a session, so it stays unguessable: 96 random bits
+        # in 16 URL-safe characters instead of a 36-character UUID string
+        session_id = secrets.token_urlsafe(12)
         config = SessionConfig(session_id=session_id, user_id=user_id)
         
-        initial_state = PRDBuilderState(
-            config=config,
-            messages=[HumanMessage(content=initial_idea)],
-            latest_user_input=initial_idea,
-            normalized_idea="",
-            prd_sections={},
-            section_order=[],
-            prd_snapshot="",
-            issues_list=[],
-            current_stage="init",
-            intent_classification=None,
-            target_section=None,
-            conversation_summary="",
-            glossary={},
-            needs_human_input=False,
-            human_feedback=None,
-            versions=[],
-            checkpoint_reason="",
-            run_assembler=False,
-            rag_enabled=False,
-            rag_context="",
-            rag_sources=[]
-        )
+        # Immutable defaults come from the template; containers are fresh per session
+        # because nodes mutate them in place
+        initial_state = cast(PRDBuilderState, {
+            **_STATE_DEFAULTS,
+            "config": config,
+            "messages": [HumanMessage(content=initial_idea)],
+            "latest_user_input": initial_idea,
+            "prd_sections": {},
+            "section_order": [],
+            "issues_list": [],
+            "glossary": {},
+            "versions": [],
+            "versions_by_id": {},
+            "rag_sources": [],
+        })
         
-        thread_config:RunnableConfig = {"configurable": {"thread_id": session_id}}
+        thread_config = self._cfg(session_id)
         
         # Run until first human input needed
         result = self.app.invoke(initial_state, config=thread_config)
+        self.invalidate_state(session_id)
         
         return {
             "session_id": session_id,
@@ -109,103 +359,80 @@ class ThinkingLensPRDBuilder:
     def send_message(self, session_id: str, message: str, attachments: List[str] | None = None) -> Dict:
         """Send a message to an existing session, optionally ingesting attachments for RAG."""
 		
-        thread_config: RunnableConfig = {"configurable": {"thread_id": session_id}}
+        thread_config = self._cfg(session_id)
 		
 		# Get current state
         snapshot = self.app.get_state(thread_config)
         if not snapshot.values:
             return {"status": "error", "message": "Session not found"}
+        initial_values = snapshot.values
 		
-        rag_context = ""
+        # New attachments turn RAG on; the flag rides along with this turn's graph input
+        enable_rag = False
+        # This turn's retrieval, if any; a concurrent turn may replace it in PENDING_RAG
+        rag_future: Optional[Future] = None
         try:
             if attachments:
+                enable_rag = True
                 self._ensure_rag()
                 
-				# Ingest PDFs and text files
+				# Ingest PDFs and text files in the background; retrieval below only sees what is already indexed
+                pdf_paths: List[str] = []
+                text_paths: List[str] = []
                 for path in attachments:
-                    if path.lower().endswith(".pdf"):
-                        try:
-                            result = self.rag.ingest_pdf(pdf_path=path, markdown_dir=f"ingested/{session_id}", extra_metadata={"session_id": session_id})
-                        except Exception as ingest_exc:
-                            print(f"[RAG][WARN] Failed to ingest PDF {path}: {ingest_exc}")
-                    elif path.lower().endswith((".txt", ".md", ".text")):
-                        try:
-                            result = self.rag.ingest_text(text_path=path, extra_metadata={"session_id": session_id})
-                        except Exception as ingest_exc:
-                            print(f"[RAG][WARN] Failed to ingest text file {path}: {ingest_exc}")
-                
-                # Set RAG as enabled for this session
-                # Update the session state to enable RAG
-                try:
-                    # Get current state again to ensure we have the latest
-                    current_snapshot = self.app.get_state(thread_config)
-                    if current_snapshot.values:
-                        # Create a new state with RAG enabled
-                        updated_state = dict(current_snapshot.values)
-                        updated_state["rag_enabled"] = True
-                        updated_state["rag_context"] = rag_context
-                        
-                        # Update the state
-                        self.app.update_state(thread_config, updated_state)
+                    suffix = path.rpartition(".")[2].lower()
+                    if suffix in _PDF_SUFFIXES:
+                        pdf_paths.append(path)
+                    elif suffix in _TEXT_SUFFIXES:
+                        text_paths.append(path)
                     else:
-                        print(f"[RAG][WARN] Could not update session state - no current values")
-                except Exception as state_update_exc:
-                    print(f"[RAG][WARN] Failed to update session state: {state_update_exc}")
+                        log.warning("[RAG] Skipping unsupported attachment %s", path)
+                supported = pdf_paths + text_paths
+                if supported:
+                    with self._ingest_lock:
+                        # All files share one job so their chunks are embedded and upserted together
+                        future = _INGEST_EXECUTOR.submit(self._ingest_attachments_batch, supported, session_id)
+                        for path in supported:
+                            self._ingest_futures[(session_id, path)] = future
                 
-				# Build initial context from the current message
-                try:
-                    docs = self.rag.semantic_search(query=message, k=5, fetch_k=50, metadata_filter={"session_id": session_id})
-                    rag_context = "\n\n".join(doc.page_content for doc in docs)
-                except Exception as srch_exc:
-                    print(f"[RAG][WARN] Retrieval failed: {srch_exc}")
+				# Build initial context from the current message; new attachments make any cached context stale.
+				# Retrieval overlaps the graph run and is only awaited by the node that reads rag_context.
+				# The new files are still being ingested, so a session without earlier documents would
+				# only pay for a guaranteed-empty search; its retrieval starts on the next turn
+                if initial_values.get("rag_enabled") and _retrieval_worthy(message):
+                    rag_future = set_pending_rag(session_id, _RETRIEVAL_EXECUTOR.submit(self._retrieve_context, session_id, message, False))
             else:
-				# If session already has RAG docs, still retrieve for this message
-                if bool(snapshot.values.get("rag_enabled", False)) and self.rag is not None:
-                    try:
-                        docs = self.rag.semantic_search(query=message, k=5, fetch_k=50, metadata_filter={"session_id": session_id})
-                        rag_context = "\n\n".join(doc.page_content for doc in docs)
-                    except Exception as srch_exc:
-                        print(f"[RAG][WARN] Retrieval failed: {srch_exc}")
+				# If session already has RAG docs, still retrieve for this message; short replies
+				# like "yes" keep the rag_context already in state
+                if bool(snapshot.values.get("rag_enabled", False)) and self.rag is not None and _retrieval_worthy(message):
+                    rag_future = set_pending_rag(session_id, _RETRIEVAL_EXECUTOR.submit(self._retrieve_context, session_id, message))
         except Exception as e:
-            print(f"[RAG][ERROR] RAG pipeline error: {e}")
+            log.exception("[RAG] RAG pipeline error: %s", e)
 		
         try:
 			# Determine if we are currently paused at an interrupt/human input
-            pending_next = getattr(snapshot, "next", None)
-            is_waiting_human = False
-            if pending_next and isinstance(pending_next, (list, tuple)):
-                is_waiting_human = "human_input" in pending_next
-            elif isinstance(pending_next, str):
-                is_waiting_human = pending_next == "human_input"
-            else:
-                try:
-                    is_waiting_human = bool(snapshot.values.get("needs_human_input", False))
-                except Exception:
-                    is_waiting_human = False
+            is_waiting_human = _is_waiting_human(snapshot)
 
             if is_waiting_human:
+                if enable_rag:
+                    # The resume payload only carries the user's text, so apply the flag as a partial update
+                    try:
+                        self.app.update_state(thread_config, {"rag_enabled": True})
+                        self.invalidate_state(session_id)
+                    except Exception as state_update_exc:
+                        log.warning("[RAG] Failed to update session state: %s", state_update_exc)
                 resume_payload: Dict[str, Any] = {"data": message}
-                if rag_context:
-                    resume_payload["rag_context"] = rag_context
-                    resume_payload["rag_enabled"] = True
                 try:
-                    events = list(self.app.stream(Command(resume=resume_payload), config=thread_config, stream_mode="values"))
-                    result = events[-1] if events else self.app.get_state(thread_config).values
-                except Exception as resume_exc:
-                    print(f"[PRD][WARN] Resume failed for {session_id}: {resume_exc}")
-                    user_input: PRDBuilderState = {"latest_user_input": message, "needs_human_input": False}
-                    if rag_context:
-                        user_input["rag_context"] = rag_context
-                        user_input["rag_enabled"] = True
-                    events = list(self.app.stream(user_input, config=thread_config, stream_mode="values"))
-                    result = events[-1] if events else self.app.get_state(thread_config).values
+                    result = self._resume_with_retry(resume_payload, thread_config, initial_values)
+                except _TRANSIENT_ERRORS as resume_exc:
+                    # Re-sending the message as fresh input could apply it twice; let the client retry
+                    log.warning("[PRD] Resume failed for %s: %s", session_id, resume_exc)
+                    return {"status": "error", "message": f"Resume failed: {resume_exc}", "retryable": True}
             else:
                 user_input: PRDBuilderState = {"latest_user_input": message, "needs_human_input": False}
-                if rag_context:
-                    user_input["rag_context"] = rag_context
+                if enable_rag:
                     user_input["rag_enabled"] = True
-                events = list(self.app.stream(user_input, config=thread_config, stream_mode="values"))
-                result = events[-1] if events else self.app.get_state(thread_config).values
+                result = self._stream_to_last(user_input, thread_config, initial_values)
 			
             return {
 				"session_id": session_id,
@@ -213,43 +440,205 @@ class ThinkingLensPRDBuilder:
 				"message": result["messages"][-1].content if result["messages"] else "Processed",
 				"stage": result["current_stage"],
 				"needs_input": result.get("needs_human_input", False),
-				"current_section": result["config"].current_section
+				"current_section": result["config"].current_section,
+				"ingestion_pending": self._pending_ingestions(session_id)
 			}
 			
         except Exception as e:
-            print(f"[PRD][ERROR] send_message failed for {session_id}: {e}")
+            log.exception("[PRD] send_message failed for %s: %s", session_id, e)
             return {"status": "error", "message": f"Error processing message: {str(e)}"}
+        finally:
+            # Drop retrieval no node consumed so it cannot leak into the next turn
+            discard_pending_rag(session_id, rag_future)
 
 
-    def get_prd_draft(self, session_id: str) -> Dict:
-        """Get the current PRD draft"""
-        thread_config:RunnableConfig = {"configurable": {"thread_id": session_id}}
-        
+    def _ingest_attachments_batch(self, paths: List[str], session_id: str) -> int:
+        """Parse and chunk every attachment concurrently, then embed and upsert all chunks in one pass"""
+        all_chunks = []
+        failures: List[str] = []
+        # Files are independent, so parse them concurrently; a separate pool avoids
+        # waiting on _INGEST_EXECUTOR from inside one of its own workers
+        with ThreadPoolExecutor(max_workers=min(8, len(paths))) as ex:
+            futs = {ex.submit(self._parse_attachment, path, session_id): path for path in paths}
+            for fut in as_completed(futs):
+                path = futs[fut]
+                try:
+                    chunks = fut.result()
+                except Exception as ingest_exc:
+                    failures.append(f"{path}: {ingest_exc}")
+                    continue
+                for chunk in chunks:
+                    chunk.metadata["source_path"] = path
+                all_chunks.extend(chunks)
+        if failures:
+            log.warning("[RAG] Failed to ingest %d attachment(s) for %s: %s", len(failures), session_id, "; ".join(failures))
+        try:
+            # Each session's chunks live in their own namespace; session_id stays in metadata for provenance
+            return self.rag.embed_docs(all_chunks, extra_metadata={"session_id": session_id}, namespace=session_id)
+        except Exception as ingest_exc:
+            log.warning("[RAG] Failed to embed %d chunks for %s: %s", len(all_chunks), session_id, ingest_exc)
+            return 0
+        finally:
+            # New chunks can change what any cached query for this session should return
+            self.rag.query_cache.clear(session_id)
+
+    def _parse_attachment(self, path: str, session_id: str) -> List[Any]:
+        if path.rpartition(".")[2].lower() in _PDF_SUFFIXES:
+            _, chunks = self.rag.parse_and_chunk_pdf(pdf_path=path, markdown_dir=f"ingested/{session_id}")
+            return chunks
+        return self.rag.parse_and_chunk_text(path)
+
+    def _retrieve_context(self, session_id: str, message: str, use_cache: bool = True) -> str:
+        """Retrieve RAG context for a message, reusing the result of a near-identical recent query"""
+        qvec = self.rag.embed_query_cached(message)
+        unit = self.rag.query_cache.normalize(qvec)
+        if use_cache:
+            cached = self.rag.query_cache.lookup(session_id, unit)
+            if cached is not None:
+                return cached
+        scored = self.rag.session_search_with_score(message, session_id, k=5, query_embedding=qvec)
+        # Only the strongest matches reach the prompts of every downstream node
+        docs = self.rag.rerank(scored, top_n=3, min_score=0.3)
+        rag_context = _cap_and_join(docs)
+        self.rag.query_cache.store(session_id, unit, rag_context)
+        return rag_context
+
+    def _pending_ingestions(self, session_id: str) -> List[str]:
+        """Attachments for the session still being ingested; finished futures are dropped"""
+        with self._ingest_lock:
+            for key in [k for k, f in self._ingest_futures.items() if f.done()]:
+                del self._ingest_futures[key]
+            return [path for (sid, path) in self._ingest_futures if sid == session_id]
+
+    def _resume_with_retry(self, resume_payload: Dict[str, Any], thread_config: RunnableConfig, initial_values: Dict) -> Dict:
+        """Resume from the human_input interrupt, retrying transient network failures with backoff"""
+        delay = 0.5
+        payload: Any = Command(resume=resume_payload)
+        for attempt in range(1, _RESUME_ATTEMPTS):
+            try:
+                return self._stream_to_last(payload, thread_config, initial_values)
+            except _TRANSIENT_ERRORS as e:
+                log.warning("[PRD] Transient failure resuming %s (attempt %d): %s", thread_config["configurable"]["thread_id"], attempt, e)
+            time.sleep(delay)
+            delay *= 2
+            # A failed run keeps the steps it finished, so continue from the checkpoint
+            # unless it never got past the interrupt
+            if not _is_waiting_human(self.app.get_state(thread_config)):
+                payload = None
+        return self._stream_to_last(payload, thread_config, initial_values)
+
+    def _stream_to_last(self, payload: Any, thread_config: RunnableConfig, initial_values: Dict) -> Dict:
+        """Run the graph and keep only the final state instead of buffering every step.
+
+        A run that emits nothing leaves the state unchanged, so initial_values stands in
+        for re-reading it from the checkpointer.
+        """
+        result = None
+        try:
+            for ev in self.app.stream(payload, config=thread_config, stream_mode="values"):
+                result = ev
+        finally:
+            self.invalidate_state(thread_config["configurable"]["thread_id"])
+        return initial_values if result is None else result
+
+    def send_message_stream(self, session_id: str, message: str) -> Iterator[Dict]:
+        """Run the graph for one message, yielding each intermediate state as it is produced.
+
+        Stops after the first state that waits for human input. Raises LookupError for an
+        unknown session.
+        """
+        thread_config = self._cfg(session_id)
         snapshot = self.app.get_state(thread_config)
+        if not snapshot.values:
+            raise LookupError("Session not found")
+        payload: Any = Command(resume=message) if _is_waiting_human(snapshot) else {
+            "latest_user_input": message,
+            "needs_human_input": False,
+        }
+        try:
+            for ev in self.app.stream(payload, config=thread_config, stream_mode="values"):
+                yield ev
+                if ev.get("needs_human_input"):
+                    break
+        finally:
+            self.invalidate_state(session_id)
+
+    def get_prd_snapshot(self, session_id: str) -> Dict:
+        """Assembled PRD and stage only, without walking the sections"""
+        snapshot = self._get_state(self._cfg(session_id))
+        if not snapshot.values:
+            return {"status": "error", "message": "Session not found"}
+        state = snapshot.values
+        return {
+            "session_id": session_id,
+            "status": "success",
+            "prd_snapshot": state["prd_snapshot"],
+            "current_stage": state["current_stage"],
+        }
+
+    def get_prd_status(self, session_id: str) -> Dict:
+        """Stage, current section and completed section keys, without section content"""
+        snapshot = self._get_state(self._cfg(session_id))
+        if not snapshot.values:
+            return {"status": "error", "message": "Session not found"}
+        state = snapshot.values
+        completed_status = SectionStatus.COMPLETED
+        return {
+            "session_id": session_id,
+            "status": "success",
+            "current_stage": state["current_stage"],
+            "current_section": state["config"].current_section,
+            "sections_completed": [key for key, section in state["prd_sections"].items() if section.status is completed_status],
+        }
+
+    def get_prd_draft(self, session_id: str, include_sections: bool = True) -> Dict:
+        """Get the current PRD draft; include_sections=False returns only get_prd_snapshot's fields"""
+        if not include_sections:
+            return self.get_prd_snapshot(session_id)
+        thread_config = self._cfg(session_id)
+        
+        snapshot = self._get_state(thread_config)
         if not snapshot.values:
             return {"status": "error", "message": "Session not found"}
         
         state = snapshot.values
+        # Every key below is initialized by start_session, so index directly
+        prd_sections = state["prd_sections"]
+        normalized_idea = state["normalized_idea"]
         
         # Build current draft
         sections_completed = {}
         sections_in_progress = {}
+        # Local bindings keep the per-section loop on fast locals
+        titles = SECTION_TITLES
+        completed_status = SectionStatus.COMPLETED
+        in_progress_status = SectionStatus.IN_PROGRESS
+        # Sections with content or work in progress count as active for the progress text
+        active_count = 0
+        active_completed_count = 0
         
-        for key, section in state["prd_sections"].items():
-            section_info = {
-                "title": PRD_TEMPLATE_SECTIONS[key]["title"],
+        for key, section in prd_sections.items():
+            status = section.status
+            active = bool(section.content) or status is in_progress_status
+            if active:
+                active_count += 1
+            if status is completed_status:
+                bucket = sections_completed
+                if active:
+                    active_completed_count += 1
+            elif status is in_progress_status:
+                bucket = sections_in_progress
+            else:
+                continue
+            bucket[key] = {
+                "title": titles[key],
                 "content": section.content,
-                "status": section.status.value,
+                "status": status.value,
                 "completion_score": section.completion_score,
-                "last_updated": section.last_updated.isoformat() if section.last_updated else None
+                "last_updated": section.last_updated_iso or (section.last_updated.isoformat() if section.last_updated else None)
             }
-            
-            if section.status == SectionStatus.COMPLETED:
-                sections_completed[key] = section_info
-            elif section.status == SectionStatus.IN_PROGRESS:
-                sections_in_progress[key] = section_info
         
-        total_sections = len(state["prd_sections"])
+        total_sections = len(prd_sections)
         completed_count = len(sections_completed)
         
         if completed_count == total_sections:
@@ -260,40 +649,49 @@ class ThinkingLensPRDBuilder:
             progress_text = f"0/{total_sections} sections completed"
         else:
             # Some sections in progress
-            active_sections = [k for k, v in state["prd_sections"].items() 
-                             if v.content or v.status == SectionStatus.IN_PROGRESS]
-            active_completed = [k for k in sections_completed.keys() 
-                               if k in active_sections]
-            progress_text = f"{len(active_completed)}/{len(active_sections)} active sections completed"
-        
-        llm = LLMInterface()
-        title = llm.generate_professional_title(state.get("normalized_idea", ""))
-
-        if "professional_title" not in state or not state.get("professional_title"):
-            state["professional_title"] = title
-        
-        professional_title = state["professional_title"]
+            progress_text = f"{active_completed_count}/{active_count} active sections completed"
         
+        # Reads never write state: until the assembler stores a title, serve a cached one
+        professional_title = state.get("professional_title") or self._professional_title(normalized_idea)
 
         return {
             "session_id": session_id,
             "status": "success",
-            "normalized_idea": state.get("normalized_idea", ""),
-            "current_stage": state.get("current_stage", ""),
+            "normalized_idea": normalized_idea,
+            "current_stage": state["current_stage"],
             "current_section": state["config"].current_section,
             "sections_completed": sections_completed,
             "sections_in_progress": sections_in_progress,
-            "prd_snapshot": state.get("prd_snapshot", ""),
-            "issues": state.get("issues_list", []),
+            "prd_snapshot": state["prd_snapshot"],
+            "issues": state["issues_list"],
             "progress": progress_text,
             "professional_title": professional_title
         }
     
-    def export_prd(self, session_id: str, format: str = "markdown") -> Dict:
-        """Export the final PRD"""
-        thread_config:RunnableConfig = {"configurable": {"thread_id": session_id}}
+    def _professional_title(self, normalized_idea: str) -> str:
+        """Title for an idea, shared across sessions through Redis when available"""
+        idea_hash = hashlib.sha1(normalized_idea.encode("utf-8")).hexdigest()
+        redis_service = self.redis_service
+        if redis_service and redis_service.redis_client:
+            try:
+                cached = redis_service.get_cached_title(idea_hash)
+                if cached:
+                    return cached
+            except Exception:
+                pass
+        title = _generated_title(normalized_idea)
+        if redis_service and redis_service.redis_client:
+            try:
+                redis_service.cache_title(idea_hash, title)
+            except Exception:
+                pass
+        return title
+
+    def export_prd(self, session_id: str, format: str = "markdown", now: Optional[datetime] = None) -> Dict:
+        """Export the final PRD; callers exporting many sessions can pass one shared timestamp as now"""
+        thread_config = self._cfg(session_id)
         
-        snapshot = self.app.get_state(thread_config)
+        snapshot = self._get_state(thread_config)
         if not snapshot.values:
             return {"status": "error", "message": "Session not found"}
         
@@ -308,34 +706,57 @@ class ThinkingLensPRDBuilder:
                 "format": "markdown",
                 "content": content,
                 "filename": f"prd_{session_id}.md",
-                "created_at": datetime.now().isoformat()
+                "created_at": (now or datetime.now()).isoformat()
             }
         
         return {"status": "error", "message": f"Format {format} not supported"}
 
     def list_versions(self, session_id: str) -> Dict:
-        thread_config: RunnableConfig = {"configurable": {"thread_id": session_id}}
-        snapshot = self.app.get_state(thread_config)
+        thread_config = self._cfg(session_id)
+        snapshot = self._get_state(thread_config)
         if not snapshot.values:
             return {"status": "error", "message": "Session not found"}
         state = snapshot.values
-        return {"status": "success", "session_id": session_id, "versions": state.get("versions", [])}
+        return {"status": "success", "session_id": session_id, "versions": materialize_all(state.get("versions", []))}
 
     def get_version(self, session_id: str, version_id: str) -> Dict:
-        thread_config: RunnableConfig = {"configurable": {"thread_id": session_id}}
-        snapshot = self.app.get_state(thread_config)
+        thread_config = self._cfg(session_id)
+        snapshot = self._get_state(thread_config)
         if not snapshot.values:
             return {"status": "error", "message": "Session not found"}
         versions = snapshot.values.get("versions", [])
-        for v in versions:
-            if v.get("version_id") == version_id:
-                return {"status": "success", "session_id": session_id, "version": v}
+        by_id = snapshot.values.get("versions_by_id")
+        if by_id is None:
+            # Sessions started before versions_by_id existed; versions are append-only,
+            # so the list length tells whether the in-process index is current
+            cached = self._version_index.get(session_id)
+            if cached is None or cached[0] != len(versions):
+                cached = (len(versions), {v.get("version_id"): i for i, v in enumerate(versions)})
+                self._version_index[session_id] = cached
+            by_id = cached[1]
+        index = by_id.get(version_id)
+        if index is not None:
+            version = materialize(versions[index], version_content(versions, index))
+            return {"status": "success", "session_id": session_id, "version": version}
         return {"status": "error", "message": "Version not found"}
 
     def _ensure_rag(self) -> None:
+        global _RAG_SINGLETON
         if self.rag is not None:
             return
         
+        # One Pinecone/Nomic setup per process, shared by every builder instance
+        with _RAG_LOCK:
+            if _RAG_SINGLETON is None:
+                _RAG_SINGLETON = self._build_rag()
+        self.rag = _RAG_SINGLETON
+
+    def _build_rag(self) -> "CompleteRagService":
+        from langchain_nomic.embeddings import NomicEmbeddings
+        from langchain_pinecone.vectorstores import PineconeVectorStore
+        from pinecone import Pinecone, ServerlessSpec
+        from RAGService import CompleteRagService
+
         nomic_key = os.getenv("NOMIC_KEY")
         pinecone_key = os.getenv("PINECONE_KEY")
         index_name = os.getenv("PINECONE_INDEX_NAME", "rag-index")
@@ -346,32 +767,26 @@ class ThinkingLensPRDBuilder:
         embedding_model = NomicEmbeddings(nomic_api_key=nomic_key, model="nomic-embed-text-v1.5")
         pc = Pinecone(api_key=pinecone_key)
         
-        # Ensure index exists
+        # Open the index optimistically; only create it when the handle can't be described
         try:
-            existing = pc.list_indexes().names()  # type: ignore[attr-defined]
+            index = pc.Index(index_name)
+            index.describe_index_stats()
         except Exception:
-            try:
-                existing = [idx.name for idx in pc.list_indexes()]  # type: ignore[assignment]
-            except Exception:
-                existing = []
-                
-        if index_name not in existing:
             pc.create_index(
                 name=index_name,
                 dimension=768,
                 metric="cosine",
                 spec=ServerlessSpec(cloud="aws", region="us-east-1"),
             )
-            
-        index = pc.Index(index_name)
+            index = pc.Index(index_name)
         vectorstore = PineconeVectorStore(embedding=embedding_model, index=index)
-        self.rag = CompleteRagService(llm=None, vectorstore=vectorstore, embedding_model=embedding_model)
+        return CompleteRagService(llm=None, vectorstore=vectorstore, embedding_model=embedding_model)
 
     def generate_flowchart(self, session_id: str, flowchart_type: str = "system_architecture") -> Dict:
         """Generate a technical flowchart based on the current PRD state"""
-        thread_config: RunnableConfig = {"configurable": {"thread_id": session_id}}
+        thread_config = self._cfg(session_id)
         
-        snapshot = self.app.get_state(thread_config)
+        snapshot = self._get_state(thread_config)
         if not snapshot.values:
             return {"status": "error", "message": "Session not found"}
         
@@ -383,7 +798,7 @@ class ThinkingLensPRDBuilder:
         
         try:
             # Check cache first
-            cache_key = f"flowchart:{session_id}:{flowchart_type}"
+            cache_key = f"flowchart:{session_id}:{flowchart_type}:{_snapshot_digest(prd_snapshot)}"
             cached_result = self._get_from_cache(cache_key)
 
             if cached_result:
@@ -397,7 +812,7 @@ class ThinkingLensPRDBuilder:
                     "cached": True                    
                 }
 
-            llm = LLMInterface()
+            llm = get_llm()
             mermaid_code = llm.generate_technical_flowchart(prd_snapshot, flowchart_type)
             if mermaid_code:
                 self._cache_result(cache_key, mermaid_code, ttl=3600)             
@@ -417,9 +832,9 @@ class ThinkingLensPRDBuilder:
 
     def generate_er_diagram(self, session_id: str, diagram_type: str = "database_schema") -> Dict:
         """Generate an ER diagram based on the current PRD state"""
-        thread_config: RunnableConfig = {"configurable": {"thread_id": session_id}}
+        thread_config = self._cfg(session_id)
         
-        snapshot = self.app.get_state(thread_config)
+        snapshot = self._get_state(thread_config)
         if not snapshot.values:
             return {"status": "error", "message": "Session not found"}
         
@@ -430,8 +845,25 @@ class ThinkingLensPRDBuilder:
             return {"status": "error", "message": "PRD not yet assembled"}
         
         try:
-            llm = LLMInterface()
+            # Check cache first
+            cache_key = f"er_diagram:{session_id}:{diagram_type}:{_snapshot_digest(prd_snapshot)}"
+            cached_result = self._get_from_cache(cache_key)
+
+            if cached_result:
+                return {
+                    "session_id": session_id,
+                    "status": "success",
+                    "diagram_type": diagram_type,
+                    "mermaid_code": cached_result,
+                    "prd_sections_used": [k for k, v in state["prd_sections"].items() if v.status == SectionStatus.COMPLETED],
+                    "generated_at": datetime.now().isoformat(),
+                    "cached": True
+                }
+
+            llm = get_llm()
             mermaid_code = llm.generate_er_diagram(prd_snapshot, diagram_type)
+            if mermaid_code:
+                self._cache_result(cache_key, mermaid_code, ttl=3600)
             
             return {
                 "session_id": session_id,
@@ -439,47 +871,39 @@ class ThinkingLensPRDBuilder:
                 "diagram_type": diagram_type,
                 "mermaid_code": mermaid_code,
                 "prd_sections_used": [k for k, v in state["prd_sections"].items() if v.status == SectionStatus.COMPLETED],
-                "generated_at": datetime.now().isoformat()
+                "generated_at": datetime.now().isoformat(),
+                "cached": False
             }
             
         except Exception as e:
             return {"status": "error", "message": f"Failed to generate ER diagram: {str(e)}"}
         
     def _get_from_cache(self, key: str) -> Optional[str]:
-        """Get cached result from Redis"""
+        """Get cached result from Redis by its full key"""
         try:
             if not self.redis_service or not self.redis_service.redis_client:
                 return None
-                
-            # Extract session_id and diagram_type from key
-            parts = key.split(":")
-            if len(parts) >= 3:
-                session_id = parts[1]
-                diagram_type = parts[2]
-                return self.redis_service.get_cached_diagram(session_id, diagram_type)
+            return self.redis_service.get_value(key)
         except Exception:
             pass
         return None
 
     def _cache_result(self, key: str, value: str, ttl: int = 3600) -> None:
-        """Cache result in Redis"""
+        """Cache result in Redis under its full key"""
         try:
-            # Extract session_id and diagram_type from key
-            parts = key.split(":")
-            if len(parts) >= 3:
-                session_id = parts[1]
-                diagram_type = parts[2]
-                self.redis_service.cache_diagram(session_id, diagram_type, value)
+            if not self.redis_service or not self.redis_service.redis_client:
+                return
+            self.redis_service.cache_value(key, value, ttl=ttl)
         except Exception:
             pass
     
     def save_session_to_database(self, session_id: str) -> Dict:
         """Save the current session state to MongoDB permanently"""
-        thread_config: RunnableConfig = {"configurable": {"thread_id": session_id}}
+        thread_config = self._cfg(session_id)
         
         try:
             # Get current state
-            snapshot = self.app.get_state(thread_config)
+            snapshot = self._get_state(thread_config)
             if not snapshot.values:
                 return {"status": "error", "message": "Session not found"}
             
@@ -504,8 +928,11 @@ class ThinkingLensPRDBuilder:
             
             # Generate and store diagrams
             try:
-                flowchart = self.generate_flowchart(session_id, "system_architecture")
-                er_diagram = self.generate_er_diagram(session_id, "database_schema")
+                # The two diagrams are independent LLM calls, so generate them side by side
+                with ThreadPoolExecutor(max_workers=2) as ex:
+                    flowchart_future = ex.submit(self.generate_flowchart, session_id, "system_architecture")
+                    er_future = ex.submit(self.generate_er_diagram, session_id, "database_schema")
+                    flowchart, er_diagram = flowchart_future.result(), er_future.result()
                 
                 prd_data["diagrams"] = {
                     "system_architecture": flowchart.get("mermaid_code", ""),
@@ -518,14 +945,10 @@ class ThinkingLensPRDBuilder:
             try:
                 if self.mongodb_service:
                     try:
-                        loop = asyncio.new_event_loop()
-                        asyncio.set_event_loop(loop)
-                        prd_id = loop.run_until_complete(
-                            self.mongodb_service.save_prd(prd_data)
-                        )
-                        loop.close()
+                        # Motor binds to the loop it first runs on, so every save uses the shared background loop
+                        prd_id = run_async(self.mongodb_service.save_prd(prd_data), timeout=30)
                     except Exception as e:
-                        print(f"Async operation failed: {e}")
+                        log.warning("Async operation failed: %s", e)
                         prd_id = "failed"
                 else:
                     prd_id = "no_mongodb_service"
@@ -552,8 +975,8 @@ class ThinkingLensPRDBuilder:
         """Ask questions about the completed PRD using RAG context"""
         try:
             # Get current session state
-            thread_config: RunnableConfig = {"configurable": {"thread_id": session_id}}
-            snapshot = self.app.get_state(thread_config)
+            thread_config = self._cfg(session_id)
+            snapshot = self._get_state(thread_config)
             
             if not snapshot.values:
                 return {"status": "error", "message": "Session not found"}
@@ -575,16 +998,11 @@ class ThinkingLensPRDBuilder:
             if state.get("rag_enabled") and self.rag:
                 try:
                     # Search for relevant documents
-                    docs = self.rag.semantic_search(
-                        query=question, 
-                        k=5, 
-                        fetch_k=50, 
-                        metadata_filter={"session_id": session_id}
-                    )
+                    docs = self.rag.session_search(question, session_id, k=5)
                     if docs:
-                        rag_context = "\n\n".join(doc.page_content for doc in docs)
+                        rag_context = _cap_and_join(docs)
                 except Exception as e:
-                    print(f"[RAG][WARN] Failed to retrieve RAG context: {e}")
+                    log.warning("[RAG] Failed to retrieve RAG context: %s", e)
             
             # Combine PRD context with RAG context
             full_context = f"PRD Content:\n{prd_context}"
@@ -592,7 +1010,7 @@ class ThinkingLensPRDBuilder:
                 full_context += f"\n\nAdditional Document Context:\n{rag_context}"
             
             # Generate answer using LLM
-            llm = LLMInterface()
+            llm = get_llm()
             answer = llm.generate_prd_answer(question, full_context)
             
             return {
@@ -612,17 +1030,53 @@ class ThinkingLensPRDBuilder:
 
     def _clear_session_cache(self, session_id: str) -> None:
         """Clear all cached data for a session"""
+        if self.rag is not None:
+            self.rag.query_cache.clear(session_id)
         try:
             if not self.redis_service or not self.redis_service.redis_client:
                 return
                 
-            # Clear PRD cache
-            self.redis_service.redis_client.delete(f"prd:cache:{session_id}")
-            
-            # Clear diagram caches
-            diagram_types = ["system_architecture", "user_flows", "database_schema"]
-            for diagram_type in diagram_types:
-                self.redis_service.redis_client.delete(f"diagram:{session_id}:{diagram_type}")
+            client = self.redis_service.redis_client
+            # One round trip for every delete; UNLINK frees the values off Redis's main thread
+            pipe = client.pipeline(transaction=False)
+            # PRD cache
+            pipe.unlink(f"prd:cache:{session_id}")
+            # Diagram caches (every type and PRD revision)
+            for pattern in (f"flowchart:{session_id}:*", f"er_diagram:{session_id}:*", f"diagram:{session_id}:*"):
+                for key in client.scan_iter(match=pattern, count=1000):
+                    pipe.unlink(key)
+            pipe.execute()
                 
         except Exception:
-            pass
\ No newline at end of file
+            pass
+    # Async entry points for the API. The graph nodes and checkpointers are
+    # synchronous, so each call runs on a worker thread to keep the event loop free.
+    async def astart_session(self, user_id: str, initial_idea: str) -> Dict:
+        return await asyncio.to_thread(self.start_session, user_id, initial_idea)
+
+    async def asend_message(self, session_id: str, message: str, attachments: List[str] | None = None) -> Dict:
+        return await asyncio.to_thread(self.send_message, session_id, message, attachments)
+
+    async def aget_prd_draft(self, session_id: str, include_sections: bool = True) -> Dict:
+        return await asyncio.to_thread(self.get_prd_draft, session_id, include_sections)
+
+    async def aget_prd_status(self, session_id: str) -> Dict:
+        return await asyncio.to_thread(self.get_prd_status, session_id)
+
+    async def alist_versions(self, session_id: str) -> Dict:
+        return await asyncio.to_thread(self.list_versions, session_id)
+
+    async def aget_version(self, session_id: str, version_id: str) -> Dict:
+        return await asyncio.to_thread(self.get_version, session_id, version_id)
+
+    async def agenerate_flowchart(self, session_id: str, flowchart_type: str = "system_architecture") -> Dict:
+        return await asyncio.to_thread(self.generate_flowchart, session_id, flowchart_type)
+
+    async def agenerate_er_diagram(self, session_id: str, diagram_type: str = "database_schema") -> Dict:
+        return await asyncio.to_thread(self.generate_er_diagram, session_id, diagram_type)
+
+    async def asave_session_to_database(self, session_id: str) -> Dict:
+        return await asyncio.to_thread(self.save_session_to_database, session_id)
+
+    async def aask_prd_question(self, session_id: str, question: str) -> Dict:
+        return await asyncio.to_thread(self.ask_prd_question, session_id, question)
@@ -1,3 +1,9 @@
+import sys
+from types import MappingProxyType
+
+# Checklist items are always rendered into prompts in sorted order, so the
+# order they are listed in here does not affect the prompt bytes (and thus
+# provider-side prefix caching). Reordering items below is safe.
 PRD_TEMPLATE_SECTIONS = {
     "problem_statement": {
         "title": "Problem Statement",
@@ -211,4 +217,24 @@ ER_DIAGRAM_PROMPTS = {
         "- Rate limiting and quotas\n"
         "- Error handling structures"
     )
-}
\ No newline at end of file
+}
+
+# Shared by every session, so expose it read-only; interned keys let lookups with
+# keys taken from here short-circuit on identity
+PRD_TEMPLATE_SECTIONS = MappingProxyType({sys.intern(key): section for key, section in PRD_TEMPLATE_SECTIONS.items()})
+
+MANDATORY_KEYS = frozenset(key for key, section in PRD_TEMPLATE_SECTIONS.items() if section["mandatory"])
+
+# Sections that list each key as a dependency, in template order; a revision marks these stale
+SECTION_DEPENDENTS = {
+    key: tuple(other for other, section in PRD_TEMPLATE_SECTIONS.items() if key in section["dependencies"])
+    for key in PRD_TEMPLATE_SECTIONS
+}
+
+# Rendered once at import so every prompt references the exact same bytes
+RENDERED_CHECKLISTS = {
+    key: "\n".join(["- " + item for item in sorted(section["checklist"])])
+    for key, section in PRD_TEMPLATE_SECTIONS.items()
+}
+
+SECTION_TITLES = {key: section["title"] for key, section in PRD_TEMPLATE_SECTIONS.items()}
@@ -0,0 +1,102 @@
+import copy
+import logging
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+log = logging.getLogger("semantic_cache")
+
+class SemanticCache:
+    """In-process semantic response cache keyed by prompt embeddings.
+
+    A lookup returns a stored response when the new prompt's embedding has cosine
+    similarity >= threshold with a cached one in the same namespace. Entries expire
+    after ttl_seconds and the least recently used are evicted past max_entries.
+    """
+
+    def __init__(self, embedding_model: Embeddings, threshold: float = 0.95, max_entries: int = 512, ttl_seconds: int = 3600) -> None:
+        self.embedding_model = embedding_model
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # namespace -> {entry_id: (unit vector as float16, response, stored_at)}
+        self._entries: Dict[str, "OrderedDict[int, Tuple[np.ndarray, Any, float]]"] = {}
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+        # Exact-text memo so repeated lookups for the same prompt embed once
+        self._vectors: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def embed(self, text: str) -> Optional[np.ndarray]:
+        """Embed text as a normalized float16 vector; None if embedding fails"""
+        with self._lock:
+            if text in self._vectors:
+                self._vectors.move_to_end(text)
+                return self._vectors[text]
+        try:
+            unit = self.normalize(self.embedding_model.embed_query(text))
+        except Exception as e:
+            log.warning("[CACHE] Embedding failed, skipping semantic cache: %s", e)
+            return None
+        if unit is None:
+            return None
+        with self._lock:
+            self._vectors[text] = unit
+            while len(self._vectors) > self.max_entries:
+                self._vectors.popitem(last=False)
+        return unit
+
+    @staticmethod
+    def normalize(vector: Any) -> Optional[np.ndarray]:
+        """Unit float16 form of an embedding computed elsewhere; None for a zero vector"""
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return None
+        return (vector / norm).astype(np.float16)
+
+    def lookup(self, namespace: str, vector: Optional[np.ndarray]) -> Any:
+        """Return a deep copy of the closest cached response, or None on a miss"""
+        if vector is None:
+            return None
+        now = time.time()
+        with self._lock:
+            entries = self._entries.get(namespace)
+            if not entries:
+                self.misses += 1
+                return None
+            for entry_id in [k for k, (_, _, ts) in entries.items() if now - ts > self.ttl_seconds]:
+                del entries[entry_id]
+            if not entries:
+                self.misses += 1
+                return None
+            ids = list(entries.keys())
+            matrix = np.stack([entries[i][0] for i in ids]).astype(np.float32)
+            scores = matrix @ vector.astype(np.float32)
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entries.move_to_end(ids[best])
+            return copy.deepcopy(entries[ids[best]][1])
+
+    def store(self, namespace: str, vector: Optional[np.ndarray], response: Any) -> None:
+        if vector is None:
+            return
+        with self._lock:
+            entries = self._entries.setdefault(namespace, OrderedDict())
+            entries[self._next_id] = (vector, copy.deepcopy(response), time.time())
+            self._next_id += 1
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def clear(self, namespace: str) -> None:
+        """Drop every entry in a namespace, e.g. after its underlying data changed"""
+        with self._lock:
+            self._entries.pop(namespace, None)
@@ -18,17 +18,20 @@ class IntentType(Enum):
     META_QUERY = "meta_query"
     OFF_TOPIC = "off_topic"
 
-@dataclass
+@dataclass(slots=True)
 class PRDSection:
     key: str
     content: str = ""
     status: SectionStatus = SectionStatus.PENDING
-    last_updated: datetime = field(default_factory=datetime.now)
+    # Set by the section updater when content is written; None until then
+    last_updated: Optional[datetime] = None
+    # ISO form of last_updated, formatted when it is written so reads don't reformat
+    last_updated_iso: str = ""
     dependencies: List[str] = field(default_factory=list)
     checklist_items: List[str] = field(default_factory=list)
     completion_score: float = 0.0
 
-@dataclass 
+@dataclass(slots=True)
 class SessionConfig:
     session_id: str
     user_id: str
@@ -51,6 +54,8 @@ class PRDBuilderState(TypedDict):
     prd_snapshot: str
     issues_list: List[str]
     versions: List[Dict[str, Any]]
+    # version_id -> position in versions, maintained alongside every append
+    versions_by_id: Dict[str, int]
     
     # Workflow control
     current_stage: Literal["init", "plan", "build", "assemble", "review", "export"]
@@ -69,6 +74,9 @@ class PRDBuilderState(TypedDict):
     run_assembler: bool
     assembler_last_run: Optional[str]
 
+    # Generated once per session and reused by get_prd_draft
+    professional_title: str
+
 	# RAG
     rag_enabled: bool
     rag_context: str
@@ -1,47 +1,143 @@
-import time
+import os
+import socket
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.util.retry import Retry
+
+
+# An IP literal skips resolving localhost, which can also try ::1 first while the server
+# listens on IPv4 (0.0.0.0) only
+BASE_URL = "http://127.0.0.1:8000"
+
+class _KeepAliveAdapter(HTTPAdapter):
+    """Adds TCP keepalive to urllib3's default socket options (which already set TCP_NODELAY)"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["socket_options"] = HTTPConnection.default_socket_options + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+        super().init_poolmanager(*args, **kwargs)
+
+
+# Every call goes to the same host, so keep its connections alive and reuse them
+_session = requests.Session()
+# Retry transient failures in the transport rather than restarting the whole run; every
+# POST carries an Idempotency-Key so the server replays a retried turn instead of re-running it
+_RETRY = Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504], allowed_methods=["GET", "POST"], raise_on_status=False)
+# One connection per concurrently running session; also the cap on parallel sessions in main()
+_POOL_SIZE = 20
+_session.mount("http://", _KeepAliveAdapter(max_retries=_RETRY, pool_connections=10, pool_maxsize=_POOL_SIZE))
+_session.headers["Connection"] = "keep-alive"
+# (connect, read): a message turn runs several LLM calls before it responds
+_TIMEOUT = (5, 120)
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+def post_url(url: str, data: dict | bytes):
+    # data may already be an encoded JSON body
+    body = data if isinstance(data, bytes) else orjson.dumps(data)
+    headers = {**_JSON_HEADERS, "Idempotency-Key": str(uuid.uuid4())}
+    r = _session.post(url, data=body, headers=headers, timeout=_TIMEOUT)
+    r.raise_for_status()
+    return orjson.loads(r.content)
 
 
-BASE_URL = "http://localhost:8000"
+def post(path: str, data: dict | bytes):
+    return post_url(f"{BASE_URL}{path}", data)
 
 
-def post(path: str, data: dict):
-    r = requests.post(f"{BASE_URL}{path}", json=data)
-    r.raise_for_status()
-    return r.json()
+# path -> (ETag, body) of the last /prd response, revalidated with If-None-Match
+_prd_cache: dict[str, tuple[str, dict]] = {}
 
 
 def get(path: str):
-    r = requests.get(f"{BASE_URL}{path}")
+    cached = _prd_cache.get(path) if "/prd" in path else None
+    headers = {"If-None-Match": cached[0]} if cached else None
+    r = _session.get(f"{BASE_URL}{path}", headers=headers, timeout=_TIMEOUT)
+    if r.status_code == 304 and cached:
+        return cached[1]
     r.raise_for_status()
-    return r.json()
-
-
-def wait_for_section_completion(session_id: str, section_key: str, timeout_s: float = 10.0, interval_s: float = 0.8) -> bool:
-    """Poll GET /prd until a section shows as completed or timeout."""
-    deadline = time.time() + timeout_s
-    while time.time() < deadline:
-        prd = get(f"/sessions/{session_id}/prd")
-        completed = prd.get("sections_completed", {})
-        if section_key in completed:
-            return True
-        time.sleep(interval_s)
-    return False
-
-
-def main():
+    body = orjson.loads(r.content)
+    etag = r.headers.get("ETag")
+    if etag and "/prd" in path:
+        _prd_cache[path] = (etag, body)
+    return body
+
+
+def wait_for_section_completion(session_id: str, section_key: str, timeout_s: float = 10.0) -> dict | None:
+    """Long-poll GET /prd/status until the section completes; the status on success, None on timeout"""
+    status = get(f"/sessions/{session_id}/prd/status?wait_for={section_key}&timeout={timeout_s}")
+    return status if section_key in status.get("sections_completed", []) else None
+
+
+IDEA = (
+    "AI app that guides PMs from a one-liner idea to a complete PRD using LangGraph "
+    "(single runtime) with HITL. Primary users: PMs at seed/Series A startups. "
+    "Exports Markdown/PDF."
+)
+
+# Answers per section; their request bodies are encoded once here rather than every turn
+section_to_answer = {
+    "goals": (
+        "Primary goal: Achieve a 50% reduction in time to produce a complete PRD within 60 days; "
+        "Secondary goals: Improve PRD measurability and cross-linkage; Business impact: faster cycle times and clearer requirements."
+    ),
+    "user_personas": (
+        "Primary persona: Startup PM (3-7 years exp), needs guided structure and measurable outputs; "
+        "Secondary personas: Eng leads and Designers who review PRDs; Journeys: draft → iterate → finalize."
+    ),
+    "core_features": (
+        "Guided Q&A, section-specific prompts, intent classifier, assembler/refiner, export to Markdown/PDF; "
+        "MVP includes planner, questioner, updater, assembler, export."
+    ),
+    "user_flows": (
+        "Flow1: Enter idea → plan → question/answer loop → assemble/refine → export; "
+        "Flow2: Revise a completed section triggers stale dependencies and re-check."
+    ),
+    "technical_architecture": (
+        "LangGraph orchestration with single LLM runtime; FastAPI backend; In-memory/SQLite checkpointer; "
+        "OpenAI models; persistence of state; optional Redis cache."
+    ),
+    "success_metrics": (
+        "KPI1: Time-to-PRD baseline 10d → target 5d in 60 days; KPI2: PRD completeness score ≥ 0.8; "
+        "Owner: PM Ops; Data source: app telemetry; timeframe: Q3."
+    ),
+    "constraints": (
+        "Technical: API quotas, token limits; Business: cost ceiling per PRD; Resources: 1-2 engs; "
+        "Assumptions: access to OpenAI; stable environment."
+    ),
+    "risks": (
+        "Technical: LLM variability; Market: PRD tools competition; Mitigations: heuristics, caching, and HITL; "
+        "Impact/Probability assessed per release."
+    ),
+    "timeline": (
+        "Milestones: MVP in 4 weeks, Beta in 8 weeks; Dependencies: model access, deployment; "
+        "Resources allocated and buffer included."
+    ),
+}
+_SECTION_BODIES = {k: orjson.dumps({"message": v}) for k, v in section_to_answer.items()}
+_STATUS_BODY = orjson.dumps({"message": "status"})
+
+# The run is done once all of these are completed
+_MANDATORY = frozenset([
+    "goals",
+    "user_personas",
+    "core_features",
+    "user_flows",
+    "technical_architecture",
+    "success_metrics",
+    "risks",
+    "constraints",
+    "timeline",
+])
+
+
+def run_session(idea: str) -> str:
+    """Drive one session from idea to exported version; returns its session id"""
     # 1) Start a session
-    start = post(
-        "/sessions",
-        {
-            "user_id": "u1",
-            "idea": (
-                "AI app that guides PMs from a one-liner idea to a complete PRD using LangGraph "
-                "(single runtime) with HITL. Primary users: PMs at seed/Series A startups. "
-                "Exports Markdown/PDF."
-            ),
-        },
-    )
+    start = post("/sessions", {"user_id": "u1", "idea": idea})
     print("start:", start)
     sid = start["session_id"]
 
@@ -58,84 +154,28 @@ def main():
     resp = post(f"/sessions/{sid}/message", {"message": problem_statement_answer})
     print("answer(problem_statement):", resp)
 
-    assert (
-        wait_for_section_completion(sid, "problem_statement", timeout_s=20.0)
-    ), "Problem Statement did not complete in time"
+    prd = wait_for_section_completion(sid, "problem_statement", timeout_s=20.0)
+    assert prd, "Problem Statement did not complete in time"
 
     # 3) Provide answers for subsequent sections in order
-    section_to_answer = {
-        "goals": (
-            "Primary goal: Achieve a 50% reduction in time to produce a complete PRD within 60 days; "
-            "Secondary goals: Improve PRD measurability and cross-linkage; Business impact: faster cycle times and clearer requirements."
-        ),
-        "user_personas": (
-            "Primary persona: Startup PM (3-7 years exp), needs guided structure and measurable outputs; "
-            "Secondary personas: Eng leads and Designers who review PRDs; Journeys: draft → iterate → finalize."
-        ),
-        "core_features": (
-            "Guided Q&A, section-specific prompts, intent classifier, assembler/refiner, export to Markdown/PDF; "
-            "MVP includes planner, questioner, updater, assembler, export."
-        ),
-        "user_flows": (
-            "Flow1: Enter idea → plan → question/answer loop → assemble/refine → export; "
-            "Flow2: Revise a completed section triggers stale dependencies and re-check."
-        ),
-        "technical_architecture": (
-            "LangGraph orchestration with single LLM runtime; FastAPI backend; In-memory/SQLite checkpointer; "
-            "OpenAI models; persistence of state; optional Redis cache."
-        ),
-        "success_metrics": (
-            "KPI1: Time-to-PRD baseline 10d → target 5d in 60 days; KPI2: PRD completeness score ≥ 0.8; "
-            "Owner: PM Ops; Data source: app telemetry; timeframe: Q3."
-        ),
-        "constraints": (
-            "Technical: API quotas, token limits; Business: cost ceiling per PRD; Resources: 1-2 engs; "
-            "Assumptions: access to OpenAI; stable environment."
-        ),
-        "risks": (
-            "Technical: LLM variability; Market: PRD tools competition; Mitigations: heuristics, caching, and HITL; "
-            "Impact/Probability assessed per release."
-        ),
-        "timeline": (
-            "Milestones: MVP in 4 weeks, Beta in 8 weeks; Dependencies: model access, deployment; "
-            "Resources allocated and buffer included."
-        ),
-    }
-
     # We'll loop until either we finish mandatory sections or hit a cap
-    mandatory_sections = [
-        "goals",
-        "user_personas",
-        "core_features",
-        "user_flows",
-        "technical_architecture",
-        "success_metrics",
-        "risks",
-        "constraints",
-        "timeline",
-    ]
-
+    # Each turn posts the answer and gets the resulting PRD state back in the same response,
+    # starting from the status the wait above already returned
+    turn_url = f"{BASE_URL}/sessions/{sid}/turn"
     for _ in range(20):  # hard cap on turns
-        prd = get(f"/sessions/{sid}/prd")
         current = prd.get("current_section")
         stage = prd.get("current_stage")
         if stage == "review" or current is None:
             break
         if current not in section_to_answer:
             # Ask for a status to keep moving
-            post(f"/sessions/{sid}/message", {"message": "status"})
-            time.sleep(0.5)
+            prd = post_url(turn_url, _STATUS_BODY)
             continue
-        msg = section_to_answer[current]
-        r = post(f"/sessions/{sid}/message", {"message": msg})
-        print(f"answer({current}):", {k: r.get(k) for k in ("stage", "current_section", "needs_input")})
-        # give the graph a moment and check completion
-        wait_for_section_completion(sid, current, timeout_s=15.0)
+        prd = post_url(turn_url, _SECTION_BODIES[current])
+        print(f"answer({current}):", {k: prd.get(k) for k in ("stage", "current_section", "needs_input")})
 
         # If all mandatory sections are done, we're done
-        prd2 = get(f"/sessions/{sid}/prd")
-        done = set(prd2.get("sections_completed", {}).keys())
-        if all(s in done for s in mandatory_sections):
+        if _MANDATORY.issubset(prd.get("sections_completed", {})):
             break
 
     # 4) Refine (enter review stage)
@@ -149,6 +189,16 @@ def main():
     versions = get(f"/sessions/{sid}/versions")
     print("versions:", versions)
     assert versions.get("versions"), "No versions recorded after export"
+    return sid
+
+
+def main():
+    # Each session's turns are sequential, but independent sessions only wait on the
+    # network, so run E2E_SESSIONS of them side by side over the shared pooled Session
+    n = int(os.getenv("E2E_SESSIONS", "1"))
+    with ThreadPoolExecutor(max_workers=min(n, _POOL_SIZE)) as ex:
+        sids = list(ex.map(run_session, [IDEA] * n))
+    print("sessions:", sids)
 
     print("FULL E2E PASS ✅")
 
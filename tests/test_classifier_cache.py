@@ -0,0 +1,49 @@
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.exceptions import OutputParserException
+
+from llm import LLMInterface
+from semantic_cache import SemanticCache
+
+
+class FailingModel:
+    """Stands in for a structured chat runnable whose output never parses"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, *args, **kwargs):
+        self.calls += 1
+        raise OutputParserException("unparseable")
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    # Clients are only built here, never called
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    service = LLMInterface()
+    embeddings = DeterministicFakeEmbedding(size=32)
+    service.embedding_model = embeddings
+    service.classifier_cache = SemanticCache(embeddings, threshold=0.92)
+    failing = FailingModel()
+    service.intent_scorer = service.intent_classifier = service.substantive_checker = failing
+    return service
+
+
+def test_failed_classify_and_score_is_not_cached(llm):
+    result = llm.classify_and_score("Our goal is halving PRD turnaround", "goals", "", ["Primary goal"])
+
+    assert result["substantive"] is False
+    assert llm.classifier_cache._entries == {}
+    # Both standalone lookups still reach the model instead of a cached fallback
+    llm.classify_intent("Our goal is halving PRD turnaround", "goals", "")
+    llm.is_substantive_section_answer("goals", "Our goal is halving PRD turnaround", ["Primary goal"])
+    assert llm.intent_scorer.calls == 3
+    assert llm.classifier_cache._entries == {}
+
+
+def test_failed_calls_are_retried_not_replayed(llm):
+    llm.classify_and_score("Our goal is halving PRD turnaround", "goals", "", ["Primary goal"])
+    llm.classify_and_score("Our goal is halving PRD turnaround", "goals", "", ["Primary goal"])
+
+    assert llm.intent_scorer.calls == 2
@@ -0,0 +1,105 @@
+import pytest
+from langchain_core.embeddings import Embeddings
+
+import semantic_cache
+from semantic_cache import SemanticCache
+
+
+class TableEmbeddings(Embeddings):
+    """Embeds from a fixed text -> vector table so similarities are exact"""
+
+    def __init__(self, table):
+        self.table = table
+        self.calls = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        if text not in self.table:
+            raise RuntimeError("embedding service down")
+        return self.table[text]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(t) for t in texts]
+
+
+TABLE = {
+    "a": [1.0, 0.0, 0.0],
+    "a-paraphrase": [0.99, 0.05, 0.0],
+    "b": [0.0, 1.0, 0.0],
+    "c": [0.0, 0.0, 1.0],
+    "zero": [0.0, 0.0, 0.0],
+}
+
+
+@pytest.fixture
+def embeddings():
+    return TableEmbeddings(TABLE)
+
+
+def test_hit_on_close_paraphrase_and_miss_below_threshold(embeddings):
+    cache = SemanticCache(embeddings, threshold=0.95)
+    cache.store("ns", cache.embed("a"), {"answer": 1})
+
+    assert cache.lookup("ns", cache.embed("a-paraphrase")) == {"answer": 1}
+    assert cache.lookup("ns", cache.embed("b")) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_namespaces_are_isolated(embeddings):
+    cache = SemanticCache(embeddings)
+    cache.store("one", cache.embed("a"), "first")
+
+    assert cache.lookup("two", cache.embed("a")) is None
+    cache.clear("one")
+    assert cache.lookup("one", cache.embed("a")) is None
+
+
+def test_entries_expire_after_ttl(embeddings, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(semantic_cache.time, "time", lambda: clock[0])
+    cache = SemanticCache(embeddings, ttl_seconds=60)
+    cache.store("ns", cache.embed("a"), "fresh")
+
+    clock[0] += 59
+    assert cache.lookup("ns", cache.embed("a")) == "fresh"
+    clock[0] += 2
+    assert cache.lookup("ns", cache.embed("a")) is None
+
+
+def test_least_recently_used_entry_is_evicted(embeddings):
+    cache = SemanticCache(embeddings, max_entries=2)
+    cache.store("ns", cache.embed("a"), "a")
+    cache.store("ns", cache.embed("b"), "b")
+    # Touch "a" so "b" becomes the least recently used
+    assert cache.lookup("ns", cache.embed("a")) == "a"
+    cache.store("ns", cache.embed("c"), "c")
+
+    assert cache.lookup("ns", cache.embed("b")) is None
+    assert cache.lookup("ns", cache.embed("a")) == "a"
+    assert cache.lookup("ns", cache.embed("c")) == "c"
+
+
+def test_lookup_returns_a_copy(embeddings):
+    cache = SemanticCache(embeddings)
+    cache.store("ns", cache.embed("a"), {"items": [1]})
+    cache.lookup("ns", cache.embed("a"))["items"].append(2)
+
+    assert cache.lookup("ns", cache.embed("a")) == {"items": [1]}
+
+
+def test_repeated_text_embeds_once(embeddings):
+    cache = SemanticCache(embeddings)
+    cache.embed("a")
+    cache.embed("a")
+
+    assert embeddings.calls == 1
+
+
+def test_unembeddable_text_bypasses_the_cache(embeddings):
+    cache = SemanticCache(embeddings)
+
+    assert cache.embed("zero") is None
+    assert cache.embed("not in table") is None
+    cache.store("ns", None, "ignored")
+    assert cache.lookup("ns", None) is None
+    assert cache._entries == {}
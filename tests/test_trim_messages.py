@@ -0,0 +1,64 @@
+from langchain_core.messages import HumanMessage, RemoveMessage
+
+from graph_nodes import _MESSAGE_KEEP, _MESSAGE_TRIM_AT, _trim_messages
+from llm import SUMMARY_WINDOW
+
+
+class RecordingSummarizer:
+    """Stands in for the LLM service; records exactly which messages each call could read"""
+
+    def __init__(self, fail_on_call=None):
+        self.seen = []
+        self.calls = 0
+        self.fail_on_call = fail_on_call
+
+    def summarize_conversation(self, messages, prev_summary=""):
+        self.calls += 1
+        if self.calls == self.fail_on_call:
+            raise RuntimeError("summarizer down")
+        # Mirror the real window: only the last SUMMARY_WINDOW messages are read
+        self.seen.extend(m.id for m in messages[-SUMMARY_WINDOW:])
+        return f"{prev_summary}|{self.calls}"
+
+
+def _state(n):
+    return {
+        "messages": [HumanMessage(content=f"m{i}", id=f"m{i}") for i in range(n)],
+        "conversation_summary": "",
+    }
+
+
+def _removed_ids(state):
+    return [m.id for m in state["messages"] if isinstance(m, RemoveMessage)]
+
+
+def test_every_removed_message_is_summarized():
+    state = _state(_MESSAGE_TRIM_AT + 1)
+    llm = RecordingSummarizer()
+    _trim_messages(state, llm)
+
+    removed = _removed_ids(state)
+    assert len(removed) == _MESSAGE_TRIM_AT + 1 - _MESSAGE_KEEP
+    assert set(removed) <= set(llm.seen)
+    assert state["conversation_summary"]
+
+
+def test_summarizer_failure_only_removes_summarized_messages():
+    state = _state(_MESSAGE_TRIM_AT + 1)
+    llm = RecordingSummarizer(fail_on_call=2)
+    _trim_messages(state, llm)
+
+    removed = _removed_ids(state)
+    assert removed == [f"m{i}" for i in range(SUMMARY_WINDOW)]
+    assert set(removed) <= set(llm.seen)
+    kept = [m.id for m in state["messages"] if not isinstance(m, RemoveMessage)]
+    assert kept == [f"m{i}" for i in range(SUMMARY_WINDOW, _MESSAGE_TRIM_AT + 1)]
+
+
+def test_short_history_is_untouched():
+    state = _state(_MESSAGE_TRIM_AT)
+    llm = RecordingSummarizer()
+    _trim_messages(state, llm)
+
+    assert llm.calls == 0
+    assert len(state["messages"]) == _MESSAGE_TRIM_AT
@@ -0,0 +1,60 @@
+import pytest
+
+from version_store import append_version, apply_delta, make_delta, materialize_all, version_content
+
+
+CASES = [
+    ("", ""),
+    ("", "# PRD\n"),
+    ("# PRD\n", ""),
+    ("a\nb\nc\n", "a\nb\nc\n"),
+    ("a\nb\nc\n", "a\nc\n"),
+    ("a\nc\n", "a\nb\nc\n"),
+    ("a\nb\nc\n", "x\ny\n"),
+    ("line one\nline two", "line one\nline 2"),
+    ("no trailing newline", "no trailing newline\n"),
+    ("## Goals\nShip fast\n## Risks\nNone\n", "## Risks\nNone\n## Goals\nShip fast\n"),
+]
+
+
+@pytest.mark.parametrize("newer,older", CASES)
+def test_delta_round_trips(newer, older):
+    assert apply_delta(newer, make_delta(newer, older)) == older
+
+
+def _history():
+    return ["# PRD v1\nGoals: TBD\n", "# PRD v2\nGoals: halve time\n", "# PRD v2\nGoals: halve time\nRisks: LLM drift\n", "# PRD v4\n"]
+
+
+def _append_all(contents):
+    versions = []
+    for i, content in enumerate(contents):
+        append_version(versions, {"version_id": f"v{i}", "content": content})
+    return versions
+
+
+def test_only_latest_version_keeps_full_content():
+    versions = _append_all(_history())
+
+    assert "content" in versions[-1]
+    assert all("delta" in v and "content" not in v for v in versions[:-1])
+
+
+def test_every_version_rebuilds_exactly():
+    contents = _history()
+    versions = _append_all(contents)
+
+    assert [version_content(versions, i) for i in range(len(versions))] == contents
+    assert [v["content"] for v in materialize_all(versions)] == contents
+    assert all("delta" not in v for v in materialize_all(versions))
+
+
+def test_legacy_full_versions_stop_the_walk():
+    contents = _history()
+    # Versions stored before deltas existed all carry full content
+    versions = [{"version_id": f"v{i}", "content": c} for i, c in enumerate(contents[:2])]
+    for i, content in enumerate(contents[2:], start=2):
+        append_version(versions, {"version_id": f"v{i}", "content": content})
+
+    assert [version_content(versions, i) for i in range(len(versions))] == contents
+    assert [v["content"] for v in materialize_all(versions)] == contents
@@ -0,0 +1,74 @@
+from difflib import SequenceMatcher
+from typing import Any, Dict, List
+
+# Only the latest exported version holds its full content; every older one holds a
+# reverse delta against the version after it.
+# Checkpoints then grow by roughly the size of each edit instead of a full PRD per export.
+# A delta is a list of ops over the newer version's lines:
+#   ["=", i1, i2]  copy lines i1:i2 of the newer version
+#   ["+", lines]   insert these lines
+
+
+def make_delta(newer: str, older: str) -> List[List[Any]]:
+    """Reverse delta that rebuilds older from newer"""
+    new_lines = newer.splitlines(keepends=True)
+    old_lines = older.splitlines(keepends=True)
+    delta: List[List[Any]] = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, new_lines, old_lines, autojunk=False).get_opcodes():
+        if tag == "equal":
+            delta.append(["=", i1, i2])
+        elif j2 > j1:
+            delta.append(["+", old_lines[j1:j2]])
+    return delta
+
+
+def apply_delta(newer: str, delta: List[List[Any]]) -> str:
+    new_lines = newer.splitlines(keepends=True)
+    out: List[str] = []
+    for op in delta:
+        if op[0] == "=":
+            out.extend(new_lines[op[1]:op[2]])
+        else:
+            out.extend(op[1])
+    return "".join(out)
+
+
+def append_version(versions: List[Dict[str, Any]], version: Dict[str, Any]) -> None:
+    """Append a full version, turning the previous latest into a delta against it"""
+    if versions and "content" in versions[-1]:
+        previous = dict(versions[-1])
+        previous["delta"] = make_delta(version["content"], previous.pop("content"))
+        versions[-1] = previous
+    versions.append(version)
+
+
+def version_content(versions: List[Dict[str, Any]], index: int) -> str:
+    """Rebuild the content of versions[index] by walking deltas back from the nearest full version"""
+    deltas = []
+    j = index
+    # Versions written before deltas existed carry full content, so the walk can stop early
+    while "content" not in versions[j]:
+        deltas.append(versions[j]["delta"])
+        j += 1
+    content = versions[j]["content"]
+    for delta in reversed(deltas):
+        content = apply_delta(content, delta)
+    return content
+
+
+def materialize(version: Dict[str, Any], content: str) -> Dict[str, Any]:
+    """API form of a stored version: full content, no delta"""
+    out = {k: v for k, v in version.items() if k != "delta"}
+    out["content"] = content
+    return out
+
+
+def materialize_all(versions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Every version with full content, rebuilt in one newest-to-oldest pass"""
+    out: List[Dict[str, Any]] = [{}] * len(versions)
+    content = ""
+    for i in range(len(versions) - 1, -1, -1):
+        version = versions[i]
+        content = version["content"] if "content" in version else apply_delta(content, version["delta"])
+        out[i] = materialize(version, content)
+    return out